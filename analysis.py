@@ -0,0 +1,296 @@
+from personalities import expressions
+from eventlog import read_session
+import numpy as np
+import time
+import csv
+import os
+import re
+
+# personalities in a fixed order, the position in this list is the code stored in the columns
+PERSONALITIES = [personality for personality in expressions if personality != "instructor"]
+COUNT_COLUMNS = ['ties_rock_rock', 'tie_1_1', 'NAO_1_0', '0_1_player', 'NAO_wins', 'player_wins']
+LOG_COLUMNS = ['rounds', 'reprompts', 'duration']
+GROUP_COUNT_COLUMNS = ['NAO_wins', 'player_wins', 'ties']
+# the store is rebuilt from scratch when it was saved with other columns
+STORE_VERSION = 2
+
+# the section of a group game also has the number of players, e.g. "------- neutral personality, 3 players -------"
+SECTION_PATTERN = re.compile(r"^------- (\w+) personality(?:, \d+ players)? -------$")
+# a round of a group game has a line per player, only the one of the first player is counted
+ROUND_PATTERN = re.compile(r"^NAO: \w+/\w+\tPLAYER(?: 1)?: ")
+REPROMPT_PATTERN = re.compile(r"^- Sorry, I didn't catch")
+LOG_FILE_PATTERN = re.compile(r"^game_(\d+)\.txt$")
+
+
+class ColumnStore:
+    def __init__(self, store_file="output/analysis.npz"):
+        """
+        A columnar store of the experiment results. Every column is a NumPy array and the store is saved as one npz
+        file. Only the rows of results.csv and the logs that were added since the last ingest are read.
+
+        :param store_file: The npz file the columns are saved to.
+        """
+        self.store_file = store_file
+        self.csv_offset = 0
+        self.columns = {'subject': np.zeros(0, dtype=np.int32),
+                        'personality': np.zeros(0, dtype=np.int8),
+                        'NAO_won': np.zeros(0, dtype=np.bool_)}
+        for column in COUNT_COLUMNS:
+            self.columns[column] = np.zeros(0, dtype=np.int16)
+        self.log_columns = {'subject': np.zeros(0, dtype=np.int32),
+                            'personality': np.zeros(0, dtype=np.int8)}
+        self.log_columns['rounds'] = np.zeros(0, dtype=np.int16)
+        self.log_columns['reprompts'] = np.zeros(0, dtype=np.int16)
+        self.log_columns['duration'] = np.zeros(0, dtype=np.float32)
+        if os.path.isfile(self.store_file):
+            self.load()
+
+    def load(self):
+        with np.load(self.store_file) as data:
+            if 'version' not in data.files or int(data['version']) != STORE_VERSION:
+                return
+            self.csv_offset = int(data['csv_offset'])
+            for column in self.columns:
+                self.columns[column] = data[column]
+            for column in self.log_columns:
+                self.log_columns[column] = data['log_' + column]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.store_file) or ".", exist_ok=True)
+        arrays = dict(self.columns)
+        arrays.update({'log_' + column: values for column, values in self.log_columns.items()})
+        # write to a temporary file first, so an interrupted save never leaves a broken store behind
+        tmp_file = self.store_file + ".tmp.npz"
+        np.savez(tmp_file, version=np.int64(STORE_VERSION), csv_offset=np.int64(self.csv_offset), **arrays)
+        os.replace(tmp_file, self.store_file)
+
+    def ingest_csv(self, csv_file="results.csv"):
+        """
+        Ingest the rows of the results CSV file added since the last ingest.
+
+        :param csv_file: Name of the CSV file with the results.
+        :return: The number of ingested rows.
+        """
+        if not os.path.isfile(csv_file):
+            return 0
+        if os.path.getsize(csv_file) < self.csv_offset:
+            # the file was replaced, start over
+            self.clear()
+        rows = []
+        with open(csv_file, 'r', newline='') as file:
+            if self.csv_offset == 0:
+                file.readline()  # header
+                self.csv_offset = file.tell()
+            else:
+                file.seek(self.csv_offset)
+            while True:
+                line = file.readline()
+                # only complete lines, a row that is being written right now is read next time
+                if not line.endswith('\n'):
+                    break
+                rows.append(line)
+                self.csv_offset = file.tell()
+        header = ['subject', 'personality', 'name', 'eye_color', 'hello_gesture'] + COUNT_COLUMNS + \
+                 ['outcome_gesture', 'winner']
+        records = [dict(zip(header, row)) for row in csv.reader(rows)]
+        records = [record for record in records if record.get('personality') in PERSONALITIES]
+        if not records:
+            return 0
+        new_columns = {'subject': np.array([int(r['subject']) for r in records], dtype=np.int32),
+                       'personality': np.array([PERSONALITIES.index(r['personality']) for r in records],
+                                               dtype=np.int8),
+                       'NAO_won': np.array([r['winner'] == "NAO" for r in records], dtype=np.bool_)}
+        for column in COUNT_COLUMNS:
+            new_columns[column] = np.array([int(r[column]) for r in records], dtype=np.int16)
+        for column, values in new_columns.items():
+            self.columns[column] = np.concatenate([self.columns[column], values])
+        return len(records)
+
+    def ingest_logs(self, output_folder="output"):
+        """
+        Ingest the txt logs of the games that were finished since the last ingest.
+
+        :param output_folder: The folder with the "game_N.txt" files.
+        :return: The number of ingested logs.
+        """
+        if not os.path.isdir(output_folder):
+            return 0
+        ingested = set(self.log_columns['subject'].tolist())
+        new_rows = []
+        for file_name in os.listdir(output_folder):
+            match = LOG_FILE_PATTERN.match(file_name)
+            if match is None or int(match.group(1)) in ingested:
+                continue
+            subject = int(match.group(1))
+            rows = parse_log(os.path.join(output_folder, file_name), subject)
+            if rows is not None:
+                durations = game_durations(subject, output_folder)
+                for row in rows:
+                    row.append(durations.get(PERSONALITIES[row[1]], np.nan))
+                new_rows.extend(rows)
+        if not new_rows:
+            return 0
+        for values, column in zip(zip(*new_rows), self.log_columns):
+            values = np.array(values, dtype=self.log_columns[column].dtype)
+            self.log_columns[column] = np.concatenate([self.log_columns[column], values])
+        return len(set(row[0] for row in new_rows))
+
+    def clear(self):
+        self.csv_offset = 0
+        for columns in (self.columns, self.log_columns):
+            for column in columns:
+                columns[column] = columns[column][:0]
+
+    def update(self, csv_file="results.csv", output_folder="output"):
+        """
+        Ingest the new results and logs and save the store if anything was added.
+
+        :param csv_file: Name of the CSV file with the results.
+        :param output_folder: The folder with the "game_N.txt" files.
+        """
+        n_rows = self.ingest_csv(csv_file)
+        n_logs = self.ingest_logs(output_folder)
+        if n_rows or n_logs:
+            self.save()
+        return n_rows, n_logs
+
+
+def parse_log(log_file, subject):
+    """
+    Count the rounds and the re-prompts for every personality in the log of one participant.
+
+    :param log_file: The path to the "game_N.txt" file.
+    :param subject: The participant's ordinal number.
+    :return: A list of [subject, personality code, rounds, reprompts] rows, or None if the experiment of the
+    participant has not finished yet.
+    """
+    with open(log_file, 'r') as file:
+        lines = file.read().split('\n')
+    if not any(line.startswith("Final results for game") for line in lines):
+        return None
+    rows = []
+    row = None
+    for line in lines:
+        match = SECTION_PATTERN.match(line)
+        if match is not None:
+            if match.group(1) not in PERSONALITIES:
+                row = None
+                continue
+            row = [subject, PERSONALITIES.index(match.group(1)), 0, 0]
+            rows.append(row)
+        elif row is not None:
+            row[2] += ROUND_PATTERN.match(line) is not None
+            row[3] += REPROMPT_PATTERN.match(line) is not None
+    return rows
+
+
+def game_durations(subject, output_folder="output"):
+    """
+    Get the duration of every game of one participant from the structured event log of the session.
+
+    :param subject: The participant's ordinal number.
+    :param output_folder: The folder with the logs.
+    :return: A dictionary {personality: duration in seconds}, empty if the session has no event log.
+    """
+    starts = {}
+    durations = {}
+    for event in read_session(subject, output_folder=output_folder):
+        if event["type"] == "game_start":
+            starts[event["game"]] = (event["personality"], event["t"])
+        elif event["type"] == "game_end" and event["game"] in starts:
+            personality, start = starts[event["game"]]
+            durations[personality] = event["t"] - start
+    return durations
+
+
+def aggregate(store):
+    """
+    Compute the aggregates per personality.
+
+    :param store: The ColumnStore.
+    :return: A dictionary of arrays indexed by the personality code.
+    """
+    n_personalities = len(PERSONALITIES)
+    columns = store.columns
+    personality = columns['personality']
+    games = np.bincount(personality, minlength=n_personalities)
+    aggregates = {'games': games,
+                  'NAO_won': np.bincount(personality, weights=columns['NAO_won'], minlength=n_personalities)}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for column in COUNT_COLUMNS:
+            total = np.bincount(personality, weights=columns[column], minlength=n_personalities)
+            aggregates[column] = total / games
+        log_personality = store.log_columns['personality']
+        for column in LOG_COLUMNS:
+            values = store.log_columns[column]
+            # games without a value (e.g. no event log for the duration) are left out of the average
+            known = ~np.isnan(values) if values.dtype.kind == 'f' else np.ones(len(values), dtype=np.bool_)
+            total = np.bincount(log_personality[known], weights=values[known], minlength=n_personalities)
+            aggregates[column] = total / np.bincount(log_personality[known], minlength=n_personalities)
+    return aggregates
+
+
+def report(store):
+    """
+    Format the aggregates per personality as a text table.
+
+    :param store: The ColumnStore.
+    :return: The report.
+    """
+    aggregates = aggregate(store)
+    columns = ['games', 'NAO_won'] + COUNT_COLUMNS + LOG_COLUMNS
+    lines = ["personality".ljust(14) + "".join(column.rjust(16) for column in columns)]
+    for code, personality in enumerate(PERSONALITIES):
+        values = []
+        for column in columns:
+            value = aggregates[column][code]
+            values.append(f"{int(value)}" if column in ('games', 'NAO_won') else f"{value:.2f}")
+        lines.append(personality.ljust(14) + "".join(value.rjust(16) for value in values))
+    n_subjects = len(np.unique(store.columns['subject']))
+    lines.append(f"{n_subjects} participants, averages per game ({', '.join(COUNT_COLUMNS + LOG_COLUMNS)})")
+    return "\n".join(lines)
+
+
+def group_report(csv_file="group_results.csv"):
+    """
+    Format the results of the group sessions (see main.run_group_session) per personality as a text table. The file
+    is small, one row per player, so it is read in full every time.
+
+    :param csv_file: Name of the CSV file with the results of the group sessions.
+    :return: The report, or None if there are no group sessions.
+    """
+    if not os.path.isfile(csv_file):
+        return None
+    with open(csv_file, 'r', newline='') as file:
+        records = [record for record in csv.DictReader(file) if record['personality'] in PERSONALITIES]
+    if not records:
+        return None
+    n_personalities = len(PERSONALITIES)
+    personality = np.array([PERSONALITIES.index(r['personality']) for r in records], dtype=np.int8)
+    players = np.bincount(personality, minlength=n_personalities)
+    sessions = [len(set(r['session'] for r in records if r['personality'] == name)) for name in PERSONALITIES]
+    nao_won = np.bincount(personality, weights=[r['winner'] == "NAO" for r in records], minlength=n_personalities)
+    columns = ['sessions', 'players', 'NAO_won'] + GROUP_COUNT_COLUMNS
+    lines = ["personality".ljust(14) + "".join(column.rjust(16) for column in columns)]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        averages = [np.bincount(personality, weights=[int(r[column]) for r in records],
+                                minlength=n_personalities) / players for column in GROUP_COUNT_COLUMNS]
+    for code, name in enumerate(PERSONALITIES):
+        values = [f"{sessions[code]}", f"{players[code]}", f"{int(nao_won[code])}"] + \
+                 [f"{column[code]:.2f}" for column in averages]
+        lines.append(name.ljust(14) + "".join(value.rjust(16) for value in values))
+    lines.append(f"{len(set(r['session'] for r in records))} group sessions, averages per player "
+                 f"({', '.join(GROUP_COUNT_COLUMNS)})")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    results_store = ColumnStore()
+    n_new_rows, n_new_logs = results_store.update()
+    print(report(results_store))
+    group_results = group_report()
+    if group_results is not None:
+        print(group_results)
+    print(f"Ingested {n_new_rows} new rows and {n_new_logs} new logs, "
+          f"report generated in {time.time() - start_time:.3f} seconds")
@@ -0,0 +1,118 @@
+# Benchmark of the sign detection backends: in the booth threads (as without a pool), the thread pool
+# (signdetector.DetectionPool) and the process pool with shared-memory frames (detection_pool.ProcessDetectionPool).
+# Several booths submit synthetic frames with colored signs at once and classify them with the color table, while a
+# game loop in the same process sleeps in short steps; its oversleep shows how much the detection holds up the rest of
+# the process.
+#
+#     python benchmarks/bench_detection.py [--booths 2] [--frames 100] [--workers 2]
+import statistics
+import argparse
+import threading
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from color_lut import build_lut
+from detection_pool import ProcessDetectionPool
+from signdetector import DetectionPool, get_detections
+
+
+def synthetic_frames(n_frames, seed=0):
+    """
+    Make frames of a light background with a few colored signs and some noise, like the camera images of a round.
+
+    :param n_frames: The number of frames.
+    :param seed: The seed of the random generator.
+    :return: A list of frames (480, 640, 3), uint8.
+    """
+    rng = np.random.default_rng(seed)
+    colors = [(200, 40, 40), (40, 160, 40), (40, 40, 200)]
+    frames = []
+    for _ in range(n_frames):
+        frame = np.full((480, 640, 3), 210, np.uint8)
+        for _ in range(4):
+            center = (int(rng.integers(60, 580)), int(rng.integers(60, 420)))
+            cv2.circle(frame, center, int(rng.integers(20, 45)), colors[rng.integers(3)], -1)
+        frames.append(np.clip(frame + rng.normal(0, 3, frame.shape), 0, 255).astype(np.uint8))
+    return frames
+
+
+class GameLoop:
+    def __init__(self, step=0.005):
+        """
+        A stand-in for the game loop: it sleeps in short steps and measures how much later than asked it wakes up.
+
+        :param step: The duration of a step, in seconds.
+        """
+        self.step = step
+        self.delays = []
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            start = time.perf_counter()
+            time.sleep(self.step)
+            self.delays.append(time.perf_counter() - start - self.step)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        return self.delays
+
+
+def run(detect, frames, n_booths):
+    """
+    Detect the frames from several booth threads at once.
+
+    :param detect: The function detecting one frame.
+    :param frames: The frames of every booth.
+    :param n_booths: The number of booths.
+    :return: The frames detected per second and the delays of the game loop.
+    """
+    loop = GameLoop()
+    booths = [threading.Thread(target=lambda: [detect(frame) for frame in frames]) for _ in range(n_booths)]
+    start = time.perf_counter()
+    for booth in booths:
+        booth.start()
+    for booth in booths:
+        booth.join()
+    elapsed = time.perf_counter() - start
+    return n_booths * len(frames) / elapsed, loop.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the detection backends.")
+    parser.add_argument("--booths", type=int, default=2)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    frames = synthetic_frames(args.frames)
+    workers = args.workers or args.booths
+    lut = build_lut()
+
+    thread_pool = DetectionPool(max_workers=workers)
+    process_pool = ProcessDetectionPool(max_workers=workers, lut=lut)
+    process_pool.detect_all(frames[0], lut=lut)  # start the workers
+    # without a pool, every booth thread detects its own frames at the same time
+    backends = [("in thread", lambda frame: get_detections(frame, lut=lut)),
+                ("thread pool", lambda frame: thread_pool.detect_all(frame, lut=lut)),
+                ("process pool", lambda frame: process_pool.detect_all(frame, lut=lut))]
+    print(f"{args.booths} booths, {args.frames} frames each, {workers} workers, {os.cpu_count()} cores")
+    for name, detect in backends:
+        throughput, delays = run(detect, frames, args.booths)
+        delays_ms = sorted(delay * 1000 for delay in delays)
+        print(f"{name:>12}: {throughput:6.1f} frames/s, game loop oversleep median "
+              f"{statistics.median(delays_ms):.2f} ms, p99 {delays_ms[int(0.99 * (len(delays_ms) - 1))]:.2f} ms")
+    thread_pool.shutdown()
+    process_pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
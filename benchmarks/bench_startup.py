@@ -0,0 +1,55 @@
+# Startup-time benchmark of "import game": how long it takes before a session can start, and which heavy backends
+# get imported. Every measurement runs in a fresh interpreter, so nothing is cached between runs.
+#
+#     python benchmarks/bench_startup.py [--runs 10] [--module game]
+import subprocess
+import statistics
+import argparse
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["cv2", "sic_framework", "sic_framework.services.dialogflow.dialogflow", "signdetector"]
+
+MEASURE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def measure(module, runs):
+    """
+    Import the module in fresh interpreters.
+
+    :param module: The name of the module to import.
+    :param runs: The number of runs.
+    :return: The import times in seconds and the heavy modules that were imported.
+    """
+    times = []
+    heavy = ""
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", MEASURE.format(module=module, heavy=HEAVY_MODULES)],
+                                cwd=ROOT, capture_output=True, text=True, check=True).stdout.split("\n")
+        times.append(float(output[0]))
+        heavy = output[1]
+    return times, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup time of importing a module.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--module", default="game")
+    args = parser.parse_args()
+
+    times, heavy = measure(args.module, args.runs)
+    print(f"import {args.module}: median {statistics.median(times) * 1000:.1f} ms, "
+          f"min {min(times) * 1000:.1f} ms, max {max(times) * 1000:.1f} ms ({args.runs} runs)")
+    print(f"heavy modules imported: {heavy or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# Benchmark of the speech gate (vad.py) against streaming all microphone audio to the recognizer. A recording is fed
+# in microphone-sized chunks; without the gate the whole listening window is streamed and the transcript comes after
+# it, with the gate only the utterances are streamed and each transcript comes shortly after its speech ends. The
+# recognizer is the local stand-in, so no Dialogflow account is needed. Without a recording, a synthetic one with
+# noise and two short "words" is used. It also checks that a short answer, e.g. "yes", is detected and that the gated
+# audio starts before the answer does.
+#
+# The gated stream is what a recognizer fed through the gate would get. In the game the Dialogflow service reads the
+# microphone itself, so its traffic is the ungated one; the gate only lets NAO stop waiting when nobody speaks.
+#
+#     python benchmarks/bench_vad.py [recording.wav] [--chunk-ms 100] [--latency 0.2]
+import argparse
+import wave
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from vad import LocalRecognizer, SpeechMonitor, VoiceActivityGate, gated_utterances, read_chunks
+
+
+def synthetic_recording(path, sample_rate=16000):
+    """
+    Write a recording of 8 seconds of background noise with two bursts of a voice-like tone.
+
+    :param path: The path of the WAV file.
+    :param sample_rate: The sample rate.
+    """
+    rng = np.random.default_rng(0)
+    audio = rng.normal(0, 80, 8 * sample_rate)
+    t = np.arange(sample_rate) / sample_rate
+    for start, duration in ((1.5, 0.6), (4.0, 0.9)):
+        n = int(duration * sample_rate)
+        voice = 4000 * np.sin(2 * np.pi * 220 * t[:n]) * np.sin(np.pi * np.arange(n) / n)
+        audio[int(start * sample_rate):int(start * sample_rate) + n] += voice
+    with wave.open(path, 'wb') as recording:
+        recording.setnchannels(1)
+        recording.setsampwidth(2)
+        recording.setframerate(sample_rate)
+        recording.writeframes(np.clip(audio, -32768, 32767).astype(np.int16).tobytes())
+
+
+def run(wav_file, chunk_ms, latency):
+    """
+    Feed the recording through the gate and the stand-in recognizer.
+
+    :param wav_file: The recording.
+    :param chunk_ms: The length of the microphone chunks.
+    :param latency: The latency of the recognizer after the end of a stream.
+    :return: The bytes streamed without and with the gate, the time of the transcript without the gate and the
+    times of the transcripts of the utterances with the gate, in seconds from the start of the recording.
+    """
+    sample_rate, chunks = read_chunks(wav_file, chunk_ms)
+    bytes_per_second = sample_rate * 2
+    gate = VoiceActivityGate(sample_rate)
+    recognizer = LocalRecognizer(bytes_per_second=bytes_per_second, latency=latency)
+    position = 0
+    utterance = None
+    finals = []
+    for chunk in chunks:
+        position += len(chunk)
+        audio, started, ended = gate.feed(chunk)
+        if started:
+            utterance = []
+        if utterance is not None and audio:
+            utterance.append(audio)
+        if ended and utterance is not None:
+            recognizer.recognize(utterance)
+            finals.append(position / bytes_per_second + latency)
+            utterance = None
+    ungated_final = position / bytes_per_second + latency
+    return position, recognizer.bytes_received, ungated_final, finals
+
+
+def check_short_utterance(duration=0.25, sample_rate=16000, chunk_ms=100):
+    """
+    Check that a short answer is not lost: the speech monitor has to report it, and its gated audio has to start
+    before the answer, thanks to the pre-roll.
+
+    :param duration: The duration of the answer, in seconds.
+    :param sample_rate: The sample rate.
+    :param chunk_ms: The length of the microphone chunks.
+    :return: Whether the monitor reported the speech and whether the gated audio covers the whole answer.
+    """
+    class Microphone:
+        def register_callback(self, callback):
+            self.callback = callback
+
+    class Message:
+        def __init__(self, waveform):
+            self.waveform = waveform
+
+    rng = np.random.default_rng(1)
+    audio = rng.normal(0, 80, 2 * sample_rate)
+    onset, n = int(0.8 * sample_rate), int(duration * sample_rate)
+    audio[onset:onset + n] += 4000 * np.sin(2 * np.pi * 220 * np.arange(n) / sample_rate) * \
+        np.sin(np.pi * np.arange(n) / n)
+    audio = np.clip(audio, -32768, 32767).astype(np.int16).tobytes()
+    chunk_bytes = int(sample_rate * chunk_ms / 1000) * 2
+    chunks = [audio[i:i + chunk_bytes] for i in range(0, len(audio), chunk_bytes)]
+
+    microphone = Microphone()
+    monitor = SpeechMonitor(microphone, sample_rate)
+    for chunk in chunks:
+        microphone.callback(Message(chunk))
+    detected = monitor.speech_started.is_set()
+    utterances = [b"".join(utterance) for utterance in gated_utterances(chunks, VoiceActivityGate(sample_rate))]
+    start = audio.find(utterances[0]) // 2 if len(utterances) == 1 else -1
+    covered = 0 <= start <= onset and start + len(utterances[0]) // 2 >= onset + n
+    return detected, covered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare streaming all audio with gated streaming.")
+    parser.add_argument("recording", nargs="?")
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    recording = args.recording
+    if recording is None:
+        recording = "bench_vad.wav"
+        synthetic_recording(recording)
+    ungated_bytes, gated_bytes, ungated_final, finals = run(recording, args.chunk_ms, args.latency)
+    print(f"streamed without gate: {ungated_bytes / 1000:.1f} kB, transcript after {ungated_final:.2f} s")
+    print(f"streamed with gate:    {gated_bytes / 1000:.1f} kB ({gated_bytes / ungated_bytes:.0%}, not used by the "
+          f"game, Dialogflow reads the microphone itself), "
+          f"{len(finals)} utterances, transcripts after " + ", ".join(f"{final:.2f} s" for final in finals))
+    detected, covered = check_short_utterance()
+    print(f"short answer (0.25 s): {'detected' if detected else 'MISSED'}, "
+          f"{'whole answer in the gated audio' if covered else 'ONSET CUT OFF'}")
+    if not (detected and covered):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# Replay a logged session from its event log: NAO's throws are drawn again from the logged seed and every round is
+# played again with the logged player colors, to check that the session is reproduced exactly.
+#
+#     python benchmarks/replay_session.py <subject> [--output output]
+#     python benchmarks/replay_session.py <session> --output output/group
+import argparse
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eventlog import read_session
+from game import Game, RoundSchedule
+
+
+def replay(subject, output_folder="output"):
+    """
+    Replay the rounds of a session.
+
+    :param subject: The participant's ordinal number.
+    :param output_folder: The folder with the event logs.
+    :return: The replayed rounds as (game, round, NAO's color, player's color, winner) and the number of rounds that
+    differ from the log; in a group session the player's colors and the winners are lists with one per player.
+    """
+    events = read_session(subject, output_folder=output_folder)
+    seeds = [event["seed"] for event in events if event["type"] == "session_start" and "seed" in event]
+    if not seeds:
+        raise RuntimeError(f"session {subject} has no logged seed")
+    game = Game(n_game=subject, output_folder=output_folder)
+    schedule = RoundSchedule(game.gesture_color.keys(), seeds[0])
+
+    rounds = {}
+    for event in events:
+        rounds.setdefault((event["game"], event["round"]), {})[event["type"]] = event
+    replayed = []
+    mismatches = 0
+    for (n_game, n_round), round_events in sorted(rounds.items()):
+        if "throw" not in round_events or "detection" not in round_events:
+            continue
+        nao_color = schedule.next_throw()
+        nao_choice = game.translate_color_to_gesture(nao_color)
+        detection = round_events["detection"]
+        if "player_colors" in detection:
+            # a round of a group session, with a winner against every player
+            player_color = detection["player_colors"]
+            winner = game.get_winners(nao_choice, [game.translate_color_to_gesture(color) for color in player_color])
+            logged_winner = round_events.get("winner", {}).get("winners")
+        else:
+            player_color = detection["player_color"]
+            winner = game.get_winner(nao_choice, game.translate_color_to_gesture(player_color))
+            logged_winner = round_events.get("winner", {}).get("winner")
+        if nao_color != round_events["throw"]["nao_color"] or winner != logged_winner:
+            mismatches += 1
+        replayed.append((n_game, n_round, nao_color, player_color, winner))
+    return replayed, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a logged session from its seed.")
+    parser.add_argument("subject", type=int)
+    parser.add_argument("--output", default="output")
+    args = parser.parse_args()
+
+    replayed, mismatches = replay(args.subject, args.output)
+    for n_game, n_round, nao_color, player_color, winner in replayed:
+        print(f"game {n_game} round {n_round}: NAO {nao_color}, player {player_color}, {winner} won")
+    print(f"{len(replayed)} rounds replayed, {mismatches} differ from the log")
+
+
+if __name__ == '__main__':
+    main()
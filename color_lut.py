@@ -0,0 +1,164 @@
+import numpy as np
+import sys
+
+# labels stored in the table; 1-3 follow the channel order of the images given to signdetector.get_colors
+COLORS = ["", "blue", "green", "red"]
+BITS = 5  # 32 bins per channel
+LUT_FILE = "color_lut.npy"
+
+
+def bin_centers(bits=BITS):
+    """
+    Get the color at the center of every bin of a table.
+
+    :param bits: The number of bits per channel kept in the table.
+    :return: An array of shape (bins, bins, bins, 3).
+    """
+    bins = 1 << bits
+    values = (np.arange(bins) << (8 - bits)) + (1 << (7 - bits))
+    return np.stack(np.meshgrid(values, values, values, indexing='ij'), axis=-1).astype(np.float32)
+
+
+def build_lut(ratio_threshold=0.6, saturation_threshold=120, bits=BITS):
+    """
+    Build the table from the calibration thresholds of signdetector.get_colors: a color is a sign color if its
+    brightest channel is more than *ratio_threshold* times the sum of the other two and its HSV saturation is above
+    *saturation_threshold*.
+
+    :param ratio_threshold: The threshold of the ratio of the brightest channel to the sum of the other two.
+    :param saturation_threshold: The threshold of the saturation (0-255).
+    :param bits: The number of bits per channel kept in the table.
+    :return: The table, a uint8 array of shape (bins, bins, bins) with indices into COLORS.
+    """
+    colors = bin_centers(bits)
+    max_color = colors.max(axis=-1)
+    sum_other_colors = colors.sum(axis=-1) - max_color
+    with np.errstate(divide='ignore', invalid='ignore'):
+        color_ratio = np.where(sum_other_colors > 0, max_color / sum_other_colors, 0)
+        saturation = np.where(max_color > 0, 255 * (max_color - colors.min(axis=-1)) / max_color, 0)
+    is_sign = (color_ratio > ratio_threshold) & (saturation > saturation_threshold)
+    return np.where(is_sign, colors.argmax(axis=-1) + 1, 0).astype(np.uint8)
+
+
+def build_lut_from_samples(pixels, labels, bits=BITS):
+    """
+    Build the table from labeled sample pixels, e.g. taken from archived frames. Every bin gets the most frequent label
+    of its samples; bins without samples are not a sign color.
+
+    :param pixels: The sample pixels, shape (n, 3), uint8.
+    :param labels: The index into COLORS of every pixel, shape (n,).
+    :param bits: The number of bits per channel kept in the table.
+    :return: The table, see build_lut.
+    """
+    bins = 1 << bits
+    pixels = np.asarray(pixels, dtype=np.uint8) >> (8 - bits)
+    index = (pixels[:, 0].astype(np.int64) * bins + pixels[:, 1]) * bins + pixels[:, 2]
+    counts = np.bincount(index * len(COLORS) + np.asarray(labels, dtype=np.int64),
+                         minlength=bins ** 3 * len(COLORS)).reshape(bins ** 3, len(COLORS))
+    lut = counts.argmax(axis=1)
+    lut[counts.sum(axis=1) == 0] = 0
+    return lut.astype(np.uint8).reshape(bins, bins, bins)
+
+
+def samples_from_archive(path, n_game, output_folder="output", background_fraction=0.01, seed=0):
+    """
+    Get labeled sample pixels from the archived frames of a session (see frame_archive), to build the table with
+    build_lut_from_samples. A frame is labeled with the color the player showed in its round, as logged in the event
+    log: the pixels in the middle of the only blob in the frame get that color, and a random part of the pixels outside
+    of it is not a sign color. Frames with no or several blobs, and the rounds of group sessions, are left out.
+
+    :param path: The base path of the archive, e.g. "output/game_1.frames".
+    :param n_game: The number of the session, for its event log.
+    :param output_folder: The folder with the event log.
+    :param background_fraction: The fraction of the pixels outside of the blob that is sampled.
+    :param seed: The seed of the sampling of the background pixels.
+    :return: The sample pixels (n, 3) and their labels (n,).
+    """
+    import cv2
+    from eventlog import read_session
+    from frame_archive import load_archive
+    from signdetector import detect_features, get_default_args, get_detections
+    parameters = get_default_args(get_detections)
+    events = read_session(n_game, output_folder=output_folder)
+    shown = {(event["game"], event["round"]): event.get("player_color") for event in events
+             if event["type"] == "detection"}
+    rng = np.random.default_rng(seed)
+    frames, meta = load_archive(path)
+    pixels, labels = [], []
+    for img, frame_game, frame_round in zip(frames, meta['game'], meta['round']):
+        color = shown.get((int(frame_game), int(frame_round)))
+        if color not in COLORS[1:]:
+            continue
+        # the same channel order as signdetector.get_colors is given
+        img = cv2.cvtColor(np.asarray(img), cv2.COLOR_BGR2RGB)
+        keypoints = detect_features(img, parameters["min_area"], parameters["max_area"],
+                                    parameters["min_circularity"], parameters["min_convexity"])
+        if len(keypoints) != 1:
+            continue
+        x, y = keypoints[0].pt
+        radius = keypoints[0].size / 2
+        rows, columns = np.ogrid[:img.shape[0], :img.shape[1]]
+        distance = np.sqrt((rows - y) ** 2 + (columns - x) ** 2)
+        inside = distance < radius / 2
+        outside = (distance > radius * 1.5) & (rng.random(distance.shape) < background_fraction)
+        pixels.extend([img[inside], img[outside]])
+        labels.extend([np.full(np.count_nonzero(inside), COLORS.index(color)), np.zeros(np.count_nonzero(outside))])
+    if not pixels:
+        return np.zeros((0, 3), dtype=np.uint8), np.zeros(0, dtype=np.uint8)
+    return np.concatenate(pixels), np.concatenate(labels).astype(np.uint8)
+
+
+def save_lut(lut, path=LUT_FILE):
+    np.save(path, lut)
+
+
+def load_lut(path=LUT_FILE):
+    return np.load(path)
+
+
+def classify_pixels(img, lut):
+    """
+    Classify every pixel with one table lookup.
+
+    :param img: An image of shape (..., 3), uint8.
+    :param lut: The table.
+    :return: The index into COLORS of every pixel, shape img.shape[:-1].
+    """
+    shift = 8 - (lut.shape[0].bit_length() - 1)
+    img = np.asarray(img, dtype=np.uint8) >> shift
+    return lut[img[..., 0], img[..., 1], img[..., 2]]
+
+
+def classify_region(region, lut, min_fraction=0.5):
+    """
+    Classify a blob by the labels of its pixels.
+
+    :param region: The pixels of the blob, shape (h, w, 3), uint8.
+    :param lut: The table.
+    :param min_fraction: The smallest fraction of pixels that have to agree on a sign color.
+    :return: The color ("red", "green", "blue" or "") and the fraction of pixels with that color.
+    """
+    if region.size == 0:
+        return "", 0.0
+    counts = np.bincount(classify_pixels(region, lut).ravel(), minlength=len(COLORS))
+    label = int(counts[1:].argmax()) + 1
+    fraction = counts[label] / counts.sum()
+    if fraction < min_fraction:
+        return "", float(fraction)
+    return COLORS[label], float(fraction)
+
+
+if __name__ == '__main__':
+    # e.g. python color_lut.py 0.6 120, or python color_lut.py output/game_1.frames to learn it from archived frames
+    if len(sys.argv) > 1 and sys.argv[1].endswith(".frames"):
+        import os
+        import re
+        archive = sys.argv[1]
+        subject = int(re.search(r"game_(\d+)\.frames$", archive).group(1))
+        sample_pixels, sample_labels = samples_from_archive(archive, subject, os.path.dirname(archive) or ".")
+        save_lut(build_lut_from_samples(sample_pixels, sample_labels))
+        print(f"Saved the color table learned from {len(sample_pixels)} pixels of {archive} to {LUT_FILE}")
+    else:
+        thresholds = [float(arg) for arg in sys.argv[1:3]]
+        save_lut(build_lut(*thresholds))
+        print(f"Saved the color table to {LUT_FILE}")
@@ -0,0 +1,121 @@
+from contextlib import contextmanager
+from metrics import registry
+
+requests_sent = registry.counter("robot_requests_sent_total", "Requests sent to the robot's devices")
+round_trips_saved = registry.counter("robot_round_trips_saved_total",
+                                     "Round-trips saved by dropping, merging or pipelining requests")
+
+
+class CommandQueue:
+    def __init__(self):
+        """
+        The requests of a robot to its devices (text-to-speech, LEDs, motion). Outside of a batch a request is sent
+        right away. Within a batch (with commands.batch(): ...) consecutive requests to the same device are held and
+        sent together when the batch ends or a request to another device comes: they are pipelined and only the last
+        one waits for the acknowledgement, consecutive speech is merged into one request, and requests that wouldn't
+        change the state of a device are dropped.
+        """
+        self.pending = []  # [device, request or speech, block, histogram, is_speech]
+        self.states = {}  # (device, key) -> last value sent
+        self.depth = 0
+        self.n_sent = 0
+        self.n_saved = 0
+
+    @contextmanager
+    def batch(self):
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                self.flush()
+
+    def request(self, device, request, block=True, histogram=None):
+        """
+        Send a request to a device, or hold it until the end of the batch.
+
+        :param device: The sic_framework connector of the device, e.g. nao.leds.
+        :param request: The request.
+        :param block: Whether to wait until the device has handled the request.
+        :param histogram: An optional metrics.Histogram for the round-trip time.
+        """
+        self._add(device, request, block, histogram, False)
+
+    def speak(self, device, text, make_request, block=True, histogram=None):
+        """
+        Say a text. Within a batch, consecutive texts for the same device are said with one request.
+
+        :param device: The text-to-speech connector, e.g. nao.tts.
+        :param text: The text, with the speech tags (e.g. the speed) of the device.
+        :param make_request: A function that makes the request for a text, e.g. NaoqiTextToSpeechRequest.
+        :param block: Whether to wait until the text is said.
+        :param histogram: An optional metrics.Histogram for the round-trip time.
+        """
+        last = self.pending[-1] if self.pending else None
+        if last is not None and last[0] is device and last[4]:
+            last[1] = (last[1][0] + " " + text, make_request)
+            last[2] = block
+            self._save()
+        else:
+            self._add(device, (text, make_request), block, histogram, True)
+
+    def changes(self, device, key, value):
+        """
+        Check whether a request would change the state of a device, and remember the new state. A request that doesn't
+        change it can be left out.
+
+        :param device: The connector of the device.
+        :param key: What the request sets, e.g. "FaceLeds color".
+        :param value: The value it sets.
+        :return: Whether the value differs from the one last sent.
+        """
+        if self.states.get((id(device), key)) == value:
+            self._save()
+            return False
+        self.states[(id(device), key)] = value
+        return True
+
+    def forget(self, device):
+        """
+        Forget the known state of a device, e.g. after an animation that changes the LEDs by itself.
+
+        :param device: The connector of the device.
+        """
+        self.states = {key: value for key, value in self.states.items() if key[0] != id(device)}
+
+    def flush(self):
+        """
+        Send the held requests. Only the last one waits for the acknowledgement, if it was sent with block=True; the
+        device handles its requests in order.
+        """
+        pending, self.pending = self.pending, []
+        for i, (device, request, block, histogram, is_speech) in enumerate(pending):
+            last = i == len(pending) - 1
+            if not last and block:
+                self._save()
+            self._send(device, request, block and last, histogram, is_speech)
+
+    def _add(self, device, request, block, histogram, is_speech):
+        if self.pending and self.pending[-1][0] is not device:
+            self.flush()
+        if self.depth == 0:
+            self._send(device, request, block, histogram, is_speech)
+        else:
+            self.pending.append([device, request, block, histogram, is_speech])
+
+    def _send(self, device, request, block, histogram, is_speech):
+        if is_speech:
+            text, make_request = request
+            request = make_request(text)
+        self.n_sent += 1
+        requests_sent.inc()
+        if histogram is not None and block:
+            with histogram.time():
+                device.request(request, block=True)
+        else:
+            device.request(request, block=block)
+
+    def _save(self):
+        self.n_saved += 1
+        round_trips_saved.inc()
@@ -0,0 +1,200 @@
+from concurrent.futures.process import BrokenProcessPool
+from concurrent.futures import Future, TimeoutError
+from multiprocessing import shared_memory
+from metrics import registry
+import multiprocessing
+import threading
+import itertools
+import queue
+import numpy as np
+
+frames_in_process = registry.counter("detection_pool_frames_in_process_total",
+                                     "Frames detected in the calling process, as they didn't fit in a slot")
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13; the workers share the resource tracker of the pool, which removes the block once
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker(slot_names, tasks, results, lut):
+    from signdetector import get_colors, get_detections
+    slots = [_attach(name) for name in slot_names]
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, slot, shape, dtype, kind, kwargs, shared_lut = task
+        if shared_lut:
+            kwargs["lut"] = lut
+        img = np.ndarray(shape, dtype=dtype, buffer=slots[slot].buf)
+        try:
+            result = (get_colors if kind == "colors" else get_detections)(img, **kwargs)
+            results.put((task_id, result, None))
+        except Exception as e:
+            results.put((task_id, None, e))
+        del img
+    for memory in slots:
+        memory.close()
+
+
+class ProcessDetectionPool:
+    def __init__(self, max_workers=None, frame_shape=(480, 640, 3), slots_per_worker=2, timeout=10.0,
+                 lut=None):
+        """
+        A pool of worker processes running get_colors, with the same interface as signdetector.DetectionPool. The
+        detection runs outside of this process, so it doesn't compete for the GIL with the game loop and the
+        sic_framework callbacks, and several detections run on several cores. The frames are copied into preallocated
+        shared-memory slots instead of being pickled; only the results are sent back.
+
+        :param max_workers: The number of worker processes; by default one per core.
+        :param frame_shape: The largest frame (height, width, channels) of uint8; larger frames are detected in this
+        process.
+        :param slots_per_worker: The number of frames that can wait for a worker.
+        :param timeout: How long to wait for a free slot or a result, in seconds, before raising TimeoutError. If a
+        worker process dies, the pool is broken: the waiting detections and every later one raise BrokenProcessPool.
+        :param lut: The color table (see color_lut) the detectors use, if any. It is sent to the workers once when they
+        start; a detection with this table only sends the frame's slot.
+        """
+        context = multiprocessing.get_context("spawn")
+        max_workers = max_workers or multiprocessing.cpu_count()
+        self.slot_size = int(np.prod(frame_shape))
+        self.slots = [shared_memory.SharedMemory(create=True, size=self.slot_size)
+                      for _ in range(max_workers * slots_per_worker)]
+        self.free_slots = queue.Queue()
+        for slot in range(len(self.slots)):
+            self.free_slots.put(slot)
+        self.futures = {}
+        self.task_ids = itertools.count()
+        self.timeout = timeout
+        self.broken = None  # the reason the pool is broken
+        self.closing = False
+        self.lut = lut
+        self._lock = threading.Lock()
+        self.tasks = context.SimpleQueue()
+        self.results = context.Queue()
+        self.workers = [context.Process(target=_worker, args=([memory.name for memory in self.slots], self.tasks,
+                                                              self.results, lut), name=f"detection-{i}", daemon=True)
+                        for i in range(max_workers)]
+        for worker in self.workers:
+            worker.start()
+        self.collector = threading.Thread(target=self.collect, name="detection-results", daemon=True)
+        self.collector.start()
+
+    def submit(self, kind, img, kwargs):
+        """
+        Hand a frame to the workers.
+
+        :param kind: "colors" for get_colors or "detections" for get_detections.
+        :param img: The frame.
+        :param kwargs: Keyword arguments for the detection; an overlay can't be drawn in another process.
+        :return: A Future of the result.
+        """
+        if kwargs.get("overlay") is not None:
+            raise ValueError("the overlay can't be drawn by a worker process")
+        img = np.ascontiguousarray(img)
+        if img.nbytes > self.slot_size:
+            from signdetector import get_colors, get_detections
+            frames_in_process.inc()
+            future = Future()
+            future.set_result((get_colors if kind == "colors" else get_detections)(img, **kwargs))
+            return future
+        if self.broken is not None:
+            raise BrokenProcessPool(self.broken)
+        try:
+            slot = self.free_slots.get(timeout=self.timeout)  # waits while all slots are in use
+        except queue.Empty:
+            raise TimeoutError(f"no free frame slot within {self.timeout} seconds") from None
+        np.copyto(np.ndarray(img.shape, dtype=img.dtype, buffer=self.slots[slot].buf), img)
+        future = Future()
+        with self._lock:
+            if self.broken is not None:
+                self.free_slots.put(slot)
+                raise BrokenProcessPool(self.broken)
+            task_id = next(self.task_ids)
+            self.futures[task_id] = future, slot
+        # the table the workers already have isn't sent along with every frame
+        lut = kwargs.get("lut")
+        shared_lut = lut is not None and self.lut is not None and lut.shape == self.lut.shape \
+            and np.array_equal(lut, self.lut)
+        if shared_lut:
+            kwargs = {key: value for key, value in kwargs.items() if key != "lut"}
+        self.tasks.put((task_id, slot, img.shape, img.dtype.str, kind, kwargs, shared_lut))
+        return future
+
+    def collect(self):
+        while True:
+            try:
+                message = self.results.get(timeout=0.5)
+            except queue.Empty:
+                message = False
+            if message is None:
+                break
+            if not self.closing and self.broken is None:
+                dead = [worker for worker in self.workers if not worker.is_alive()]
+                if dead:
+                    self.fail(f"detection worker {dead[0].name} exited with code {dead[0].exitcode}")
+            if message is False:
+                continue
+            task_id, result, error = message
+            with self._lock:
+                if task_id not in self.futures:
+                    continue  # already failed
+                future, slot = self.futures.pop(task_id)
+            self.free_slots.put(slot)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def fail(self, reason):
+        """
+        Mark the pool as broken and fail the detections that are waiting for a result; the task a dead worker was
+        running is never answered.
+
+        :param reason: What broke the pool.
+        """
+        with self._lock:
+            self.broken = reason
+            pending, self.futures = self.futures, {}
+        for future, slot in pending.values():
+            self.free_slots.put(slot)
+            future.set_exception(BrokenProcessPool(reason))
+
+    def detect(self, img, **kwargs):
+        """
+        Run get_colors in a worker process and wait for the result.
+
+        :param img: The image to detect the colors in.
+        :param kwargs: Keyword arguments passed to get_colors.
+        :return: The list of detected colors.
+        """
+        return self.submit("colors", img, kwargs).result(timeout=self.timeout)
+
+    def detect_all(self, img, **kwargs):
+        """
+        Run get_detections in a worker process and wait for the result.
+
+        :param img: The image to detect the signs in.
+        :param kwargs: Keyword arguments passed to get_detections.
+        :return: The list of Detection.
+        """
+        return self.submit("detections", img, kwargs).result(timeout=self.timeout)
+
+    def shutdown(self):
+        self.closing = True
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(self.timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self.results.put(None)
+        self.collector.join()
+        self.results.close()
+        for memory in self.slots:
+            memory.close()
+            memory.unlink()
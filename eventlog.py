@@ -0,0 +1,146 @@
+import threading
+import struct
+import json
+import time
+import os
+
+# one index record per (game, round) of a session: game, round, byte offset of its first event
+INDEX_RECORD = struct.Struct("<hhQ")
+
+
+class EventLog:
+    def __init__(self, n_game, output_folder="output"):
+        """
+        An append-only log of typed events of one session, one JSON object per line in "game_N.events.jsonl". The
+        offset of the first event of every game and round is stored in the small binary index "game_N.events.idx",
+        so a single round can be read by seeking instead of scanning the whole log.
+
+        :param n_game: The number of the game (the participant's ordinal number).
+        :param output_folder: The folder for the log and the index.
+        """
+        self.n_game = n_game
+        self.log_file = os.path.join(output_folder, f"game_{n_game}.events.jsonl")
+        self.index_file = os.path.join(output_folder, f"game_{n_game}.events.idx")
+        self.index = load_index(self.index_file)
+        # the events of the session before the first game are logged as game -1
+        self.game = -1
+        self.round = 0
+        self._lock = threading.Lock()
+
+    def start_game(self, game):
+        """
+        Log the following events as part of the game with the given number (0, 1 or 2 for the 3 personalities).
+
+        :param game: The number of the game in the session.
+        """
+        self.game = game
+        self.round = 0
+
+    def start_round(self):
+        """
+        Log the following events as part of the next round of the current game.
+        """
+        self.round += 1
+
+    def write(self, event_type, **fields):
+        """
+        Append an event to the log.
+
+        :param event_type: The type of the event, e.g. "round_start", "throw", "detection", "winner" or "reaction".
+        :param fields: The fields of the event; they must be JSON serializable.
+        :return: The event.
+        """
+        event = {"type": event_type, "t": round(time.time(), 3), "game": self.game, "round": self.round}
+        event.update(fields)
+        line = (json.dumps(event) + "\n").encode()
+        with self._lock:
+            os.makedirs(os.path.dirname(self.log_file) or ".", exist_ok=True)
+            with open(self.log_file, 'ab') as file:
+                offset = file.seek(0, os.SEEK_END)
+                file.write(line)
+            key = (self.game, self.round)
+            if key not in self.index:
+                self.index[key] = offset
+                with open(self.index_file, 'ab') as file:
+                    file.write(INDEX_RECORD.pack(self.game, self.round, offset))
+        return event
+
+    def read(self, game=None, round=None):
+        """
+        Read the events of the session, of one game or of one round.
+
+        :param game: The number of the game, or None for the whole session.
+        :param round: The number of the round, or None for the whole game.
+        :return: A list of events.
+        """
+        return read_events(self.log_file, self.index, game, round)
+
+
+def load_index(index_file):
+    """
+    Load the offset index of a session.
+
+    :param index_file: The path to the "game_N.events.idx" file.
+    :return: A dictionary {(game, round): offset}.
+    """
+    index = {}
+    if os.path.isfile(index_file):
+        with open(index_file, 'rb') as file:
+            data = file.read()
+        # ignore a record that is being written right now
+        data = data[:len(data) - len(data) % INDEX_RECORD.size]
+        for game, round_, offset in INDEX_RECORD.iter_unpack(data):
+            index[(game, round_)] = offset
+    return index
+
+
+def read_events(log_file, index, game=None, round=None):
+    """
+    Read the events of a session log, seeking to the requested game or round with the index.
+
+    :param log_file: The path to the "game_N.events.jsonl" file.
+    :param index: The index of the log, see load_index.
+    :param game: The number of the game, or None for the whole session.
+    :param round: The number of the round, or None for the whole game.
+    :return: A list of events.
+    """
+    if not os.path.isfile(log_file):
+        return []
+    if game is None:
+        keys = list(index)
+    elif round is None:
+        keys = [key for key in index if key[0] == game]
+    else:
+        keys = [key for key in index if key == (game, round)]
+    if not keys:
+        return []
+    offsets = sorted(index.values())
+    start = min(index[key] for key in keys)
+    last = max(index[key] for key in keys)
+    following = [offset for offset in offsets if offset > last]
+    with open(log_file, 'rb') as file:
+        file.seek(start)
+        data = file.read(following[0] - start) if following else file.read()
+    events = []
+    for line in data.splitlines():
+        if not line.endswith(b"}"):
+            continue  # an event that is being written right now
+        event = json.loads(line)
+        if (event["game"], event["round"]) in keys:
+            events.append(event)
+    return events
+
+
+def read_session(n_game, game=None, round=None, output_folder="output"):
+    """
+    Read the events of a session, of one game or of one round from the output folder.
+
+    :param n_game: The number of the game (the participant's ordinal number).
+    :param game: The number of the game in the session, or None for the whole session.
+    :param round: The number of the round, or None for the whole game.
+    :param output_folder: The folder with the logs.
+    :return: A list of events.
+    """
+    log_file = os.path.join(output_folder, f"game_{n_game}.events.jsonl")
+    index_file = os.path.join(output_folder, f"game_{n_game}.events.idx")
+    return read_events(log_file, load_index(index_file), game, round)
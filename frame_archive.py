@@ -0,0 +1,199 @@
+from metrics import registry
+import numpy as np
+import threading
+import struct
+import queue
+import sys
+import os
+
+archive_dropped = registry.counter("frame_archive_dropped_total", "Frames not archived because the writer fell behind")
+# the open archives of the process, e.g. one per booth
+archives = []
+registry.gauge("frame_archive_queue_depth", "Frames waiting to be archived, in all archives",
+               lambda: sum(archive.queue.qsize() for archive in list(archives)))
+
+# metadata of every archived frame; an entry with time 0 is not used (yet)
+META_DTYPE = np.dtype([('time', 'f8'), ('game', 'i2'), ('round', 'i2')])
+# fixed size of the .npy headers, so the header can be rewritten when the file grows
+HEADER_SIZE = 256
+
+
+def npy_header(shape, dtype):
+    """
+    Make a .npy (version 1.0) header of HEADER_SIZE bytes.
+
+    :param shape: The shape of the array.
+    :param dtype: The dtype of the array.
+    :return: The header.
+    """
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False,
+                   'shape': tuple(shape)})
+    header = header.ljust(HEADER_SIZE - 11) + "\n"
+    return np.lib.format.magic(1, 0) + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class GrowingArray:
+    def __init__(self, path, shape, dtype, chunk):
+        """
+        A .npy file written through a memory map that grows by *chunk* rows when it is full and is truncated to the
+        written rows when it is closed.
+
+        :param path: The path of the file.
+        :param shape: The shape of a row.
+        :param dtype: The dtype.
+        :param chunk: The number of rows the file grows by.
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.chunk = chunk
+        self.row_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.n_rows = 0
+        self.capacity = 0
+        self.array = None
+        self.file = open(path, 'w+b')
+        self.grow()
+
+    def grow(self):
+        if self.array is not None:
+            self.array.flush()
+            self.array = None
+        self.capacity += self.chunk
+        self.file.truncate(HEADER_SIZE + self.capacity * self.row_size)
+        self.write_header(self.capacity)
+        self.array = np.memmap(self.file, dtype=self.dtype, mode='r+', offset=HEADER_SIZE,
+                               shape=(self.capacity,) + self.shape)
+
+    def write_header(self, n_rows):
+        self.file.seek(0)
+        self.file.write(npy_header((n_rows,) + self.shape, self.dtype))
+        self.file.flush()
+
+    def append(self, row):
+        if self.n_rows == self.capacity:
+            self.grow()
+        self.array[self.n_rows] = row
+        self.n_rows += 1
+
+    def close(self):
+        self.array.flush()
+        self.array = None
+        self.file.truncate(HEADER_SIZE + self.n_rows * self.row_size)
+        self.write_header(self.n_rows)
+        self.file.close()
+
+
+class FrameArchive:
+    def __init__(self, path, capacity=2000, chunk=100):
+        """
+        An archive of the camera frames used for detection in one session. The frames are written by a background
+        thread into a memory-mapped file, so archiving never slows down the game loop. The file grows in chunks and
+        is cut to the archived frames when the archive is closed. The archive is two .npy files that can be opened
+        with np.load(mmap_mode='r'), see load_archive.
+
+        :param path: The base path of the archive, e.g. "output/game_1.frames".
+        :param capacity: The largest number of frames the archive holds; later frames are not archived.
+        :param chunk: The number of frames the file grows by, about 90 MB for 640x480 frames.
+        """
+        self.path = path
+        self.capacity = capacity
+        self.chunk = chunk
+        self.frames = None
+        self.meta = None
+        self.n_frames = 0
+        self.n_dropped = 0
+        self.queue = queue.Queue(maxsize=256)
+        archives.append(self)
+        self.thread = threading.Thread(target=self.run, name="frame-archive", daemon=True)
+        self.thread.start()
+
+    def submit(self, img, timestamp, game=-1, round=0):
+        """
+        Archive a frame. The frame is only handed to the background thread; if it falls behind, the frame is dropped
+        instead of waiting.
+
+        :param img: The frame as received from the camera.
+        :param timestamp: The time the frame was captured.
+        :param game: The number of the game in the session.
+        :param round: The number of the round in the game.
+        """
+        try:
+            self.queue.put_nowait((img, timestamp, game, round))
+        except queue.Full:
+            self.n_dropped += 1
+            archive_dropped.inc()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            img, timestamp, game, round_ = item
+            if self.frames is None:
+                self.allocate(img.shape, img.dtype)
+            if self.n_frames >= self.capacity or img.shape != self.frames.shape:
+                self.n_dropped += 1
+                continue
+            self.frames.append(img)
+            self.meta.append((timestamp, game, round_))
+            self.n_frames += 1
+
+    def allocate(self, shape, dtype):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.frames = GrowingArray(self.path + ".npy", shape, dtype, self.chunk)
+        self.meta = GrowingArray(self.path + ".meta.npy", (), META_DTYPE, self.chunk)
+
+    def close(self):
+        """
+        Write the remaining frames, cut the files to the archived frames and close them.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.frames is not None:
+            self.frames.close()
+            self.meta.close()
+        archives.remove(self)
+
+
+def load_archive(path):
+    """
+    Open an archive of frames without reading it into memory.
+
+    :param path: The base path of the archive, e.g. "output/game_1.frames".
+    :return: The frames and their metadata (time, game, round), only the archived entries.
+    """
+    frames = np.load(path + ".npy", mmap_mode='r')
+    meta = np.load(path + ".meta.npy", mmap_mode='r')
+    n_frames = int(np.count_nonzero(meta['time']))
+    return frames[:n_frames], meta[:n_frames]
+
+
+def replay_archive(path, game=None, round=None, **params):
+    """
+    Run the detection again on the archived frames, e.g. to check a disputed round or to try other parameters.
+
+    :param path: The base path of the archive.
+    :param game: Only replay the frames of this game.
+    :param round: Only replay the frames of this round.
+    :param params: Parameters for signdetector.get_colors.
+    :return: A list of (time, game, round, colors).
+    """
+    import cv2
+    from signdetector import get_colors
+    frames, meta = load_archive(path)
+    selected = np.ones(len(meta), dtype=np.bool_)
+    if game is not None:
+        selected &= meta['game'] == game
+    if round is not None:
+        selected &= meta['round'] == round
+    results = []
+    for i in np.flatnonzero(selected):
+        img = cv2.cvtColor(np.asarray(frames[i]), cv2.COLOR_BGR2RGB)
+        results.append((float(meta['time'][i]), int(meta['game'][i]), int(meta['round'][i]), get_colors(img, **params)))
+    return results
+
+
+if __name__ == '__main__':
+    # e.g. python frame_archive.py output/game_1.frames [game] [round]
+    args = [int(arg) for arg in sys.argv[2:4]]
+    for timestamp, n_game, n_round, colors in replay_archive(sys.argv[1], *args):
+        print(f"{timestamp:.3f}\tgame {n_game}\tround {n_round}\t{colors}")
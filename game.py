@@ -1,28 +1,96 @@
-from sic_framework.devices import Nao
-from sic_framework.devices.nao import NaoqiTextToSpeechRequest
-from sic_framework.services.dialogflow.dialogflow import (DialogflowConf, GetIntentRequest, RecognitionResult,
-                                                          QueryResult, Dialogflow)
-from sic_framework.devices.common_desktop.desktop_microphone import DesktopMicrophone
-from sic_framework.devices.common_naoqi.naoqi_leds import NaoLEDRequest, NaoFadeRGBRequest
-from sic_framework.devices.nao import NaoqiAnimationRequest
-from sic_framework.devices.common_naoqi.naoqi_motion_recorder import (NaoqiMotionRecording, StartRecording,
-                                                                      StopRecording, PlayRecording,
-                                                                      NaoqiMotionRecorderConf)
-from signdetector import ColorDetector
+# the backends (sic_framework devices and services, signdetector with OpenCV) are imported where they are needed,
+# so that e.g. a desktop run without camera and microphone starts fast and doesn't require them
+from commands import CommandQueue
+from eventlog import EventLog
+from metrics import registry
 from personalities import expressions, instructions
+import threading
 import random
 import time
 import json
 import csv
 import os
 
-answer = ""
-button_pressed = False
+reprompts = registry.counter("robot_reprompts_total", "Times the player was asked to show the sign again")
+tts_seconds = registry.histogram("robot_tts_seconds", "Round-trip time of a text-to-speech request")
+motion_seconds = registry.histogram("robot_motion_seconds", "Round-trip time of a motion or animation request")
+led_seconds = registry.histogram("robot_led_seconds", "Round-trip time of changing the eye color")
+
+# recorded motions of NAO's throws
+MOTION_FILES = {"rock": "recorded_motions/rock2.motion",
+                "paper": "recorded_motions/paper2.motion",
+                "scissors": "recorded_motions/scissors2.motion"}
+
+# NAO's fixed phrases; they can be synthesized ahead of time, see tts_cache.py
+DEFAULT_SPEED = 90
+COUNTDOWN_SPEED = 85
+COUNT_OF_THREE = "On the count of three..."
+READY = "Ready?"
+ONE_TWO_THREE = "One, two, three!"
+ASK_START = "Are you ready to start the game?"
+CONTINUE = "Ok, let's continue"
+PRESS_BUTTON = "Press the black button on one of my feet."
+BUTTON_START = "To start the game,"
+BUTTON_READY = "If you understand the rules and are ready to begin the experiment,"
+BUTTON_NEXT = "After completing the survey, to play with the next robot,"
+ASK_SIGN_AGAIN = "Sorry, I didn't catch which sign you're showing. Could you please show it to me again?"
+NAO_LEADS = "One, zero in my favor!"
+PLAYER_LEADS = "One, zero in your favor!"
+ONE_ONE = "One, one!"
+WELCOME = "Hello, I'm {name}! Welcome to the experiment."
+ASK_SURVEY = "Now, please take a short survey about your gaming experience with my friend."
+ASK_FINAL_SURVEY = ("Now, similarly, please take a survey about your gaming experience with my friend and "
+                    "thank you for participating in our experiment! "
+                    "After this survey, please also complete the final questionnaire. "
+                    "Your feedback is valuable to us!")
+# the phrases with the speed they are said at (WELCOME also needs the name)
+FIXED_PHRASES = [(COUNT_OF_THREE, DEFAULT_SPEED), (READY, DEFAULT_SPEED), (ONE_TWO_THREE, COUNTDOWN_SPEED),
+                 (ASK_START, DEFAULT_SPEED), (CONTINUE, DEFAULT_SPEED), (PRESS_BUTTON, DEFAULT_SPEED),
+                 (BUTTON_START, DEFAULT_SPEED), (BUTTON_READY, DEFAULT_SPEED), (BUTTON_NEXT, DEFAULT_SPEED),
+                 (ASK_SIGN_AGAIN, DEFAULT_SPEED), (NAO_LEADS, DEFAULT_SPEED), (PLAYER_LEADS, DEFAULT_SPEED),
+                 (ONE_ONE, DEFAULT_SPEED), (ASK_SURVEY, DEFAULT_SPEED), (ASK_FINAL_SURVEY, DEFAULT_SPEED)]
+
+
+class RoundSchedule:
+    def __init__(self, colors, seed=None):
+        """
+        A pre-planned, reproducible schedule of NAO's throws for one session. The throws are drawn from a random
+        generator with a known seed, so they are known ahead of time and the session can be replayed from the seed.
+
+        :param colors: The colors NAO can choose from.
+        :param seed: The seed of the schedule; a new random seed is chosen if None.
+        """
+        self.colors = list(colors)
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(2 ** 32)
+        self._random = random.Random(self.seed)
+        self.throws = []
+        self.position = 0
+
+    def peek(self, ahead=0):
+        """
+        Get a future throw without using it.
+
+        :param ahead: How many throws after the next one.
+        :return: The color of the throw.
+        """
+        while len(self.throws) <= self.position + ahead:
+            self.throws.append(self._random.choice(self.colors))
+        return self.throws[self.position + ahead]
+
+    def next_throw(self):
+        """
+        Use the next throw of the schedule.
+
+        :return: The color of the throw.
+        """
+        color = self.peek()
+        self.position += 1
+        return color
 
 
 class Game:
     def __init__(self, n_game, rock_color="red", paper_color="blue",
-                 scissors_color="green"):
+                 scissors_color="green", log_sink=None, results_store=None, seed=None, output_folder="output"):
         """
         Initialize a Game instance by specifying the game number, colors associated with each gesture (rock, paper,
         scissors), and defining rules and robot names based on their personalities.
@@ -31,12 +99,29 @@ class Game:
         :param rock_color: The color associated with the rock gesture.
         :param paper_color: The color associated with the paper gesture.
         :param scissors_color: The color associated with the scissors gesture.
+        :param log_sink: Optional shared sink (see orchestrator.SharedLogSink) that writes the output instead of this
+        game opening its own txt file.
+        :param results_store: Optional shared store (see orchestrator.ResultsStore) that writes the results instead of
+        this game appending to "results.csv" directly.
+        :param seed: The seed of NAO's throws (see RoundSchedule); a new random seed is chosen if None.
+        :param output_folder: The folder for the txt log, the event log and the archived frames of the session.
         """
         self.n_game = n_game
+        self.output_folder = output_folder
+        self.log_sink = log_sink
+        self.results_store = results_store
+        # latest answer and button state, kept per game so that several games can run in one process
+        self.answer = ""
+        self.button_pressed = False
+        # whether a transcript is an answer; a request that is still open after NAO stopped listening is ignored
+        self.accept_transcripts = False
+        # structured log of the session next to the txt log
+        self.events = EventLog(n_game, output_folder)
         # color to gesture translation
         self.gesture_color = {rock_color: "rock",
                               paper_color: "paper",
                               scissors_color: "scissors"}
+        self.schedule = RoundSchedule(self.gesture_color.keys(), seed)
 
         # combinations [winner, loser]
         self.rules = [["scissors", "paper"],
@@ -57,11 +142,53 @@ class Game:
         :param output: The output to print and write to a file.
         """
         print(output)
-        output_file_path = os.path.join("output", f"game_{self.n_game}.txt")
+        if self.log_sink is not None:
+            self.log_sink.write(self.n_game, output)
+            return
+        output_file_path = os.path.join(self.output_folder, f"game_{self.n_game}.txt")
         file = open(output_file_path, 'a')
         file.write('\n' + output)
         file.close()
 
+    def log_event(self, event_type, **fields):
+        """
+        Append a typed event to the structured log of the session (see eventlog.EventLog).
+
+        :param event_type: The type of the event.
+        :param fields: The fields of the event.
+        """
+        self.events.write(event_type, **fields)
+
+    def save_result(self, personality, result):
+        """
+        Store the result of the game with one personality as a row of the results CSV file.
+
+        :param personality: The personality the game was played with.
+        :param result: The dictionary with the game result returned by Robot.play_game.
+        """
+        personality_result = [self.n_game] + [personality] + list(result.values())
+        if self.results_store is not None:
+            self.results_store.write_row(personality_result)
+            return
+        with open('results.csv', 'a', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(personality_result)
+
+    def save_group_result(self, personality, result, csv_file="group_results.csv"):
+        """
+        Store the result of a group game as one row per player of the group results CSV file.
+
+        :param personality: The personality the game was played with.
+        :param result: The dictionary with the game result returned by Robot.play_group_game.
+        :param csv_file: Name of the CSV file with the results of the group sessions.
+        """
+        with open(csv_file, 'a', newline='') as file:
+            writer = csv.writer(file)
+            for player, winner in enumerate(result['winners']):
+                writer.writerow([self.n_game, personality, result['name'], player + 1, result['rounds'],
+                                 result['NAO_wins'][player], result['player_wins'][player], result['ties'][player],
+                                 winner])
+
     def translate_color_to_gesture(self, color):
         """
         Translate a given color to a corresponding gesture.
@@ -88,31 +215,40 @@ class Game:
             winner = "No one"
         return winner
 
+    def get_winners(self, nao_choice, player_choices):
+        """
+        Determine the winner of NAO's round against each of several players.
+
+        :param nao_choice: The gesture chosen by NAO.
+        :param player_choices: The gestures chosen by the players.
+        :return: A list with the winner against each player ("NAO", "player", or "No one").
+        """
+        return [self.get_winner(nao_choice, player_choice) for player_choice in player_choices]
+
     def on_dialog(self, message):
         """
-        Handle the dialog messages and update the global answer variable.
+        Handle the dialog messages and update the answer of the game.
 
         :param message: The dialog message received.
         """
-        global answer
-        if message.response:
+        if message.response and self.accept_transcripts:
             if message.response.recognition_result.is_final:
-                answer = message.response.recognition_result.transcript
-                self.print_output(f"Transcript: {answer}")
+                self.answer = message.response.recognition_result.transcript
+                self.print_output(f"Transcript: {self.answer}")
 
     def button_func(self, a):
         """
-        Handle the button press event and update the global button_pressed variable.
+        Handle the button press event and update the button state of the game.
 
         :param a: The button press event.
         """
-        global button_pressed
         self.print_output(f"Button pressed: {a.value}")
-        button_pressed = True
+        self.button_pressed = True
 
 
 class Robot:
-    def __init__(self, ip, game, personality="neutral", name="NAO", mode="robot", use_mic=False, use_camera=True):
+    def __init__(self, ip, game, personality="neutral", name="NAO", mode="robot", use_mic=False, use_camera=True,
+                 detection_pool=None, capture_frames=False, tts_cache=None, lut_file=None):
         """
         Initialize a Robot instance.
 
@@ -123,7 +259,19 @@ class Robot:
         :param mode: The mode in which the game is played ("robot" or "desktop").
         :param use_mic: Whether a microphone is used.
         :param use_camera: Whether a camera is used.
-        """
+        :param detection_pool: Optional signdetector.DetectionPool shared with other robots running in the same
+        process.
+        :param capture_frames: Whether to archive the camera frames used for detection in every session (see
+        frame_archive.FrameArchive).
+        :param tts_cache: Optional tts_cache.UtteranceCache; utterances in it are played from the cache instead of being
+        synthesized by NAO. On the robot it has to be built with NAO's own engine (tts_cache.NaoEngine), so that the
+        participants hear a single voice.
+        :param lut_file: Optional color table (see color_lut.py, e.g. "color_lut.npy") the color detector classifies the
+        signs with, instead of the color thresholds.
+        """
+        if mode == "robot" and tts_cache is not None and tts_cache.engine.parameters["engine"] != "naoqi":
+            raise ValueError(f"the utterances played on NAO must be rendered by NAO, not by "
+                             f"{tts_cache.engine.parameters['engine']}")
         self.ip = ip
         self.game = game
         self.personality = personality
@@ -131,30 +279,75 @@ class Robot:
         self.mode = mode
         self.use_mic = use_mic
         self.use_camera = use_camera
+        self.capture_frames = capture_frames
+        self.tts_cache = tts_cache
+        # loaded recordings of the throws, and the thread loading the next one
+        self.motions = {}
+        self.staging = None
+        # the requests to NAO's devices, see commands.py
+        self.commands = CommandQueue()
         sample_rate = 0
         connect = None
+        lut = None
+        if self.use_camera:
+            from signdetector import ColorDetector
+            if lut_file is not None:
+                from color_lut import load_lut
+                lut = load_lut(lut_file)
         if self.mode == "robot":
+            from sic_framework.devices import Nao
             self.nao = Nao(ip=self.ip)
             if self.use_camera:
-                self.color_detector = ColorDetector(ip=self.ip)
+                self.color_detector = ColorDetector(ip=self.ip, detection_pool=detection_pool, lut=lut)
             # button
-            self.nao.buttons.register_callback(self.game.button_func)
+            self.nao.buttons.register_callback(self.on_button)
             if self.use_mic:
                 connect = self.nao.mic
                 sample_rate = 16000
         elif self.mode == "desktop":
             if self.use_camera:
-                self.color_detector = ColorDetector(ip=self.ip, use_pc_webcam=True)
+                self.color_detector = ColorDetector(ip=self.ip, use_pc_webcam=True,
+                                                    detection_pool=detection_pool, lut=lut)
             if self.use_mic:
+                from sic_framework.devices.common_desktop.desktop_microphone import DesktopMicrophone
                 connect = DesktopMicrophone(ip='localhost')
                 sample_rate = 44100
         if self.use_mic:
+            from sic_framework.services.dialogflow.dialogflow import DialogflowConf, Dialogflow
             json_file = "my-dialogflow.json"
             keyfile_json = json.load(open(json_file))
             conf = DialogflowConf(keyfile_json=keyfile_json, sample_rate_hertz=sample_rate, language='en')
             self.dialogflow = Dialogflow(ip='localhost', conf=conf)
             self.dialogflow.connect(connect)
-            self.dialogflow.register_callback(self.game.on_dialog)
+            self.dialogflow.register_callback(self.on_dialog)
+            # stop waiting for a recognition request when nobody speaks, see vad.py and listen
+            from vad import SpeechMonitor
+            self.speech_monitor = SpeechMonitor(connect, sample_rate)
+            self.listening = None
+
+    def on_button(self, a):
+        """
+        Forward the button press event to the current game.
+
+        :param a: The button press event.
+        """
+        self.game.button_func(a)
+
+    def on_dialog(self, message):
+        """
+        Forward the dialog message to the current game.
+
+        :param message: The dialog message received.
+        """
+        self.game.on_dialog(message)
+
+    def change_game(self, new_game):
+        """
+        Change the game of the robot, e.g. for the next participant, while keeping the connections to the devices.
+
+        :param new_game: The new Game instance.
+        """
+        self.game = new_game
 
     def change_name(self, new_name):
         """
@@ -172,7 +365,7 @@ class Robot:
         """
         self.personality = new_personality
 
-    def say(self, speech, speed=90, block=True):
+    def say(self, speech, speed=DEFAULT_SPEED, block=True):
         """
         Make the robot say a speech with a specified speed if mode is set to "robot". Otherwise, just print the speech.
 
@@ -182,7 +375,35 @@ class Robot:
         """
         self.game.print_output(f"- {speech}")
         if self.mode == "robot":
-            self.nao.tts.request(NaoqiTextToSpeechRequest(f"\\rspd={speed}\\" + speech), block=block)
+            audio = self.tts_cache.get(speech, speed) if self.tts_cache is not None else None
+            if audio is not None:
+                from sic_framework.core.message_python2 import AudioRequest
+                waveform, sample_rate = audio
+                self.commands.request(self.nao.speaker, AudioRequest(waveform=waveform, sample_rate=sample_rate),
+                                      block=block, histogram=tts_seconds)
+                return
+            from sic_framework.devices.nao import NaoqiTextToSpeechRequest
+            self.commands.speak(self.nao.tts, f"\\rspd={speed}\\" + speech, NaoqiTextToSpeechRequest, block=block,
+                                histogram=tts_seconds)
+
+    def listen(self, time_limit):
+        """
+        Recognize one answer with Dialogflow. The request is opened right away, so Dialogflow hears the answer from its
+        first syllable; the voice activity gate only ends the wait early when nobody starts speaking within
+        *time_limit*, instead of waiting for Dialogflow's own timeout. The request itself can't be ended from here, as
+        the Dialogflow service reads the microphone directly: it keeps streaming until Dialogflow closes it, and is
+        waited for in the next attempt rather than opening a second one. Its transcript is ignored once NAO has stopped
+        listening (see Game.accept_transcripts).
+
+        :param time_limit: How long to wait for someone to start speaking, in seconds.
+        """
+        from sic_framework.services.dialogflow.dialogflow import GetIntentRequest
+        if self.listening is None or not self.listening.is_alive():
+            self.listening = threading.Thread(target=self.dialogflow.request, args=(GetIntentRequest(),),
+                                              name="dialogflow-request", daemon=True)
+            self.listening.start()
+        if self.speech_monitor.wait_for_speech(time_limit):
+            self.listening.join()
 
     def recognize_speech(self, expected, use_mic, time_limit=8, speech_button=""):
         """
@@ -198,9 +419,7 @@ class Robot:
         :param speech_button: The speech to prompt the user for a button press.
         :return: The recognized speech.
         """
-        global button_pressed
-        global answer
-        answer = ""
+        self.game.answer = ""
         attempts = 0
         max_attempts = 2
         self.game.print_output(f"*** NAO is listening, expected input: '{expected[0]}' "
@@ -208,40 +427,42 @@ class Robot:
 
         if use_mic:
             if expected[0] == "yes":
-                self.say("Are you ready to start the game?")
-            while answer not in expected and attempts < max_attempts:
-                self.dialogflow.request(GetIntentRequest())
+                self.say(ASK_START)
+            self.game.accept_transcripts = True
+            while self.game.answer not in expected and attempts < max_attempts:
                 attempts += 1
+                self.listen(time_limit)
+            self.game.accept_transcripts = False
         elif not use_mic and self.mode == "desktop":
             if self.use_camera:
                 time.sleep(3)
-                self.say("Ok, let's continue")
-                answer = expected[0]
+                self.say(CONTINUE)
+                self.game.answer = expected[0]
             else:
                 if expected[0] == "yes":
-                    self.say("Are you ready to start the game?")
-                while answer not in expected and attempts < max_attempts:
-                    answer = input()
+                    self.say(ASK_START)
+                while self.game.answer not in expected and attempts < max_attempts:
+                    self.game.answer = input()
                     attempts += 1
 
-        if answer not in expected:
+        if self.game.answer not in expected:
             if self.mode == "robot":
                 self.say(speech_button)
-                self.say("Press the black button on one of my feet.")
-                button_pressed = False
+                self.say(PRESS_BUTTON)
+                self.game.button_pressed = False
                 start_time = time.time()
-                while button_pressed is False:
-                    answer = ""
+                while self.game.button_pressed is False:
+                    self.game.answer = ""
                     if time.time() - start_time >= time_limit:
                         # Timeout occurred
-                        answer = expected[1]
-                        return answer
-                answer = expected[0]
+                        self.game.answer = expected[1]
+                        return self.game.answer
+                self.game.answer = expected[0]
             else:
-                self.say("Ok, let's continue")
-                answer = expected[0]
+                self.say(CONTINUE)
+                self.game.answer = expected[0]
 
-        return answer
+        return self.game.answer
 
     def show_gesture(self, gesture, block=False):
         """
@@ -254,20 +475,47 @@ class Robot:
         """
         self.game.print_output(f"*** NAO is showing {gesture} ***")
         if self.mode == "robot":
-            if gesture == "rock":
-                recording = NaoqiMotionRecording.load("recorded_motions/rock2.motion")
-                self.nao.motion_record.request(PlayRecording(recording), block=block)
-            elif gesture == "paper":
-                recording = NaoqiMotionRecording.load("recorded_motions/paper2.motion")
-                self.nao.motion_record.request(PlayRecording(recording), block=block)
-            elif gesture == "scissors":
-                recording = NaoqiMotionRecording.load("recorded_motions/scissors2.motion")
-                self.nao.motion_record.request(PlayRecording(recording), block=block)
+            from sic_framework.devices.nao import NaoqiAnimationRequest
+            from sic_framework.devices.common_naoqi.naoqi_motion_recorder import PlayRecording
+            if gesture in MOTION_FILES:
+                if self.staging is not None:
+                    self.staging.join()
+                    self.staging = None
+                if gesture not in self.motions:
+                    self.load_motion(gesture)
+                self.commands.request(self.nao.motion_record, PlayRecording(self.motions[gesture]), block=block,
+                                      histogram=motion_seconds)
             else:
-                self.nao.motion.request(NaoqiAnimationRequest(f"animations/Stand/Gestures/{gesture}"), block=block)
+                self.commands.request(self.nao.motion, NaoqiAnimationRequest(f"animations/Stand/Gestures/{gesture}"),
+                                      block=block, histogram=motion_seconds)
+                # animations can change the eye color by themselves
+                self.commands.forget(self.nao.leds)
                 if gesture == "Hey_1":
                     self.change_eye_color(expressions[self.personality]["eye color"])
 
+    def load_motion(self, gesture):
+        """
+        Load the recorded motion of a rock, paper or scissors gesture.
+
+        :param gesture: The gesture ("rock", "paper" or "scissors").
+        """
+        from sic_framework.devices.common_naoqi.naoqi_motion_recorder import NaoqiMotionRecording
+        self.motions[gesture] = NaoqiMotionRecording.load(MOTION_FILES[gesture])
+
+    def stage_gesture(self, gesture):
+        """
+        Prepare the motion of a rock, paper or scissors gesture in the background, e.g. during the speech before it is
+        shown, so that show_gesture can play it right away.
+
+        :param gesture: The gesture ("rock", "paper" or "scissors").
+        """
+        if self.mode != "robot" or gesture not in MOTION_FILES or gesture in self.motions:
+            return
+        if self.staging is not None:
+            self.staging.join()
+        self.staging = threading.Thread(target=self.load_motion, args=(gesture,))
+        self.staging.start()
+
     def change_eye_color(self, color):
         """
         Change the color of NAO's eyes based on the specified color.
@@ -277,6 +525,7 @@ class Robot:
         """
         self.game.print_output(f"*** NAO's eyes turned {color} ***")
         if self.mode == "robot":
+            from sic_framework.devices.common_naoqi.naoqi_leds import NaoLEDRequest, NaoFadeRGBRequest
             if color in ["red", "green", "blue"]:
                 colors = [int((color == "red")), int((color == "green")), int((color == "blue"))]
             elif color == "yellow":
@@ -285,13 +534,22 @@ class Robot:
                 colors = [120, 0, 225]
             else:  # white
                 colors = [255, 255, 255]
-            self.nao.leds.request(NaoLEDRequest("FaceLeds", True))
-            self.nao.leds.request(NaoFadeRGBRequest("FaceLeds", colors[0], colors[1], colors[2], 0))
-
-    def recognize_player_color(self):
+            # both requests are sent at once and only the last one is waited for; a request that doesn't change the
+            # LEDs is left out
+            with self.commands.batch():
+                if self.commands.changes(self.nao.leds, "FaceLeds on", True):
+                    self.commands.request(self.nao.leds, NaoLEDRequest("FaceLeds", True), histogram=led_seconds)
+                if self.commands.changes(self.nao.leds, "FaceLeds color", tuple(colors)):
+                    self.commands.request(self.nao.leds,
+                                          NaoFadeRGBRequest("FaceLeds", colors[0], colors[1], colors[2], 0),
+                                          histogram=led_seconds)
+
+    def recognize_player_color(self, since=None):
         """
         Recognize the color shown to the camera or typed by the user.
 
+        :param since: The time (as returned by time.time()) from which the frames of the camera are used for the first
+        attempt, e.g. the start of the countdown, so that a sign shown during the countdown is not lost.
         :return: The recognized color ("red", "green", or "blue").
         """
         recognized_color = None
@@ -301,14 +559,91 @@ class Robot:
         else:
             print("Recognizing color...")
             while recognized_color is None:
-                recognized_color = self.color_detector.detect_sign()
+                recognized_color = self.color_detector.detect_sign(since=since,
+                                                                   ids=(self.game.events.game, self.game.events.round))
+                # after asking again, only the frames captured after the question are used
+                since = None
                 if recognized_color is None:
-                    self.say("Sorry, I didn't catch which sign you're showing. "
-                             "Could you please show it to me again?")
+                    reprompts.inc()
+                    self.say(ASK_SIGN_AGAIN)
                 else:
                     print(f"Recognized {recognized_color} color")
         return recognized_color
 
+    def recognize_player_colors(self, n_players, since=None, tracker=None):
+        """
+        Recognize the colors shown to the camera by several players at once, or typed for each player.
+
+        :param n_players: The number of players, standing side by side in front of the camera.
+        :param since: The time from which the frames of the camera are used for the first attempt, see
+        recognize_player_color.
+        :param tracker: An optional signdetector.SignTracker that follows the players' positions; by default every
+        player has a fixed zone of the frame.
+        :return: A list with the recognized color of every player.
+        """
+        if not self.use_camera:
+            return [self.recognize_player_color() for _ in range(n_players)]
+        print("Recognizing colors...")
+        colors = [None] * n_players
+        while None in colors:
+            detected = self.color_detector.detect_signs(n_players, since=since, tracker=tracker,
+                                                        ids=(self.game.events.game, self.game.events.round))
+            since = None
+            colors = [old if old is not None else new for old, new in zip(colors, detected)]
+            missing = [str(player + 1) for player, color in enumerate(colors) if color is None]
+            if missing:
+                reprompts.inc()
+                self.say(f"Sorry, I didn't catch the sign of player {' and '.join(missing)}. "
+                         "Could you please show it to me again?")
+            else:
+                print(f"Recognized {colors} colors")
+        return colors
+
+    def play_group_round(self, n_players, tracker=None):
+        """
+        Play one round against several players at once, with one detection pass for all of their signs.
+
+        :param n_players: The number of players.
+        :param tracker: An optional signdetector.SignTracker, see recognize_player_colors.
+        :return: A list with the winner against each player ("NAO", "player", or "No one").
+        """
+        self.game.events.start_round()
+        self.game.log_event("round_start", players=n_players)
+        nao_color = self.game.schedule.next_throw()
+        nao_choice = self.game.translate_color_to_gesture(nao_color)
+        self.game.log_event("throw", nao_color=nao_color, nao_choice=nao_choice,
+                            schedule_position=self.game.schedule.position - 1)
+        self.stage_gesture(nao_choice)
+        with self.commands.batch():
+            self.say(COUNT_OF_THREE)
+            self.say(READY)
+        self.show_gesture(nao_choice, block=False)
+        countdown_time = time.time()
+        self.say(ONE_TWO_THREE, speed=COUNTDOWN_SPEED)
+        self.change_eye_color(nao_color)
+        detection_start = time.time()
+        player_colors = self.recognize_player_colors(n_players, since=countdown_time, tracker=tracker)
+        player_choices = [self.game.translate_color_to_gesture(color) for color in player_colors]
+        self.game.log_event("detection", player_colors=player_colors, player_choices=player_choices,
+                            source="camera" if self.use_camera else "keyboard",
+                            duration=round(time.time() - detection_start, 3))
+        winners = self.game.get_winners(nao_choice, player_choices)
+        with self.commands.batch():
+            self.say(f"I chose {nao_choice}!")
+            for player, (player_choice, winner) in enumerate(zip(player_choices, winners)):
+                self.game.print_output(f"NAO: {nao_color}/{nao_choice}\tPLAYER {player + 1}: "
+                                       f"{player_colors[player]}/{player_choice}")
+                self.game.print_output(f"{winner} won")
+                if winner == "player":
+                    self.say(f"Player {player + 1}, your {player_choice} beats me!")
+                elif winner == "NAO":
+                    self.say(f"Player {player + 1}, I beat your {player_choice}!")
+                else:
+                    self.say(f"Player {player + 1}, we both chose {player_choice}!")
+        self.game.log_event("winner", winners=winners)
+        self.change_eye_color(expressions[self.personality]["eye color"])
+        return winners
+
     def personal_greeting(self):
         """
         Output a personalized greeting based on the robot's personality.
@@ -337,16 +672,17 @@ class Robot:
         self.game.print_output(f"*** NAO's {self.personality} reaction ***")
         exp = expressions[self.personality]
         if NAO_wins > player_wins:
-            self.say("One, zero in my favor!")
+            self.say(NAO_LEADS)
             reaction = exp["intermediate result"]["NAO winning"]
         elif NAO_wins < player_wins:
-            self.say("One, zero in your favor!")
+            self.say(PLAYER_LEADS)
             reaction = exp["intermediate result"]["player winning"]
         elif NAO_wins == player_wins:
-            self.say("One, one!")
+            self.say(ONE_ONE)
             reaction = exp["tie"]["1:1"]
         gesture = reaction["gesture"]
         speech = reaction["speech"]
+        self.game.log_event("reaction", kind="intermediate", gesture=gesture, speech=speech)
         if gesture is not None:
             self.show_gesture(gesture)
         self.say(speech)
@@ -358,6 +694,7 @@ class Robot:
         reaction = expressions[self.personality]["tie"]["rock-rock"]
         gesture = reaction["gesture"]
         speech = reaction["speech"]
+        self.game.log_event("reaction", kind="tie", gesture=gesture, speech=speech)
         if gesture is not None:
             self.show_gesture(gesture)
         self.say(speech)
@@ -382,6 +719,7 @@ class Robot:
             reaction = expressions[self.personality]["game outcome"]["player wins"]
         gesture = reaction["gesture"]
         speech = reaction["speech"]
+        self.game.log_event("reaction", kind="outcome", gesture=gesture, speech=speech)
         if gesture is not None:
             self.show_gesture(gesture)
         self.say(speech)
@@ -415,26 +753,39 @@ class Robot:
         while start != "yes":
             start = self.recognize_speech(["yes", "no"], use_mic=self.use_mic,
                                           time_limit=8,
-                                          speech_button="To start the game,")
+                                          speech_button=BUTTON_START)
         NAO_wins = 0
         player_wins = 0
         while NAO_wins < 2 and player_wins < 2:
             winner_defined = False
             while not winner_defined:
-                self.say("On the count of three...")
-                nao_color = random.choice(list(self.game.gesture_color.keys()))
+                self.game.events.start_round()
+                self.game.log_event("round_start", NAO_wins=NAO_wins, player_wins=player_wins)
+                nao_color = self.game.schedule.next_throw()
                 nao_choice = self.game.translate_color_to_gesture(nao_color)
-                self.say("Ready?")
+                self.game.log_event("throw", nao_color=nao_color, nao_choice=nao_choice,
+                                    schedule_position=self.game.schedule.position - 1)
+                # the motion is prepared while NAO is counting, so it starts right at "Ready?"
+                self.stage_gesture(nao_choice)
+                with self.commands.batch():
+                    self.say(COUNT_OF_THREE)
+                    self.say(READY)
                 self.show_gesture(nao_choice, block=False)
-                self.say("One, two, three!", speed=85)
+                countdown_time = time.time()
+                self.say(ONE_TWO_THREE, speed=COUNTDOWN_SPEED)
                 self.change_eye_color(nao_color)
-                player_color = self.recognize_player_color()
+                detection_start = time.time()
+                player_color = self.recognize_player_color(since=countdown_time)
                 player_choice = self.game.translate_color_to_gesture(player_color)
+                self.game.log_event("detection", player_color=player_color, player_choice=player_choice,
+                                    source="camera" if self.use_camera else "keyboard",
+                                    duration=round(time.time() - detection_start, 3))
                 time.sleep(1)
                 self.say(f"I chose {nao_choice}, and you chose {player_choice}!")
                 winner = self.game.get_winner(nao_choice, player_choice)
                 self.game.print_output(f"NAO: {nao_color}/{nao_choice}\tPLAYER: {player_color}/{player_choice}")
                 self.game.print_output(f"{winner} won")
+                self.game.log_event("winner", winner=winner)
                 time.sleep(1)
                 self.change_eye_color(personality_eye_color)
                 if winner == "NAO":
@@ -456,12 +807,71 @@ class Robot:
         result["player_wins"] = player_wins
         result["outcome_gesture"] = outcome_gesture
         result["winner"] = final_winner
+        self.game.log_event("game_end", result=result)
         self.personal_goodbye()
         # change eye color back to the default white color
         self.change_eye_color("white")
         self.show_gesture("BowShort_1")
         return result
 
+    def play_group_game(self, n_players, n_rounds=3, tracker=None):
+        """
+        Play a game against several players at once. Every round NAO throws once and each player shows a sign, so the
+        game has a fixed number of rounds; the winner against every player is the one who won more of the rounds.
+
+        :param n_players: The number of players.
+        :param n_rounds: The number of rounds.
+        :param tracker: An optional signdetector.SignTracker, see recognize_player_colors.
+        :return: A dictionary containing the game result, with a list of counts and a winner per player.
+        """
+        self.game.print_output(f"------- {self.personality} personality, {n_players} players -------")
+        personality_eye_color = expressions[self.personality]["eye color"]
+        result = {'name': self.name,
+                  'eye_color': personality_eye_color,
+                  'players': n_players,
+                  'rounds': n_rounds,
+                  'NAO_wins': [0] * n_players,
+                  'player_wins': [0] * n_players,
+                  'ties': [0] * n_players,
+                  'winners': []}
+        self.change_eye_color(personality_eye_color)
+        self.personal_greeting()
+        start = "no"
+        while start != "yes":
+            start = self.recognize_speech(["yes", "no"], use_mic=self.use_mic,
+                                          time_limit=8,
+                                          speech_button=BUTTON_START)
+        for _ in range(n_rounds):
+            winners = self.play_group_round(n_players, tracker=tracker)
+            for player, winner in enumerate(winners):
+                key = {"NAO": 'NAO_wins', "player": 'player_wins'}.get(winner, 'ties')
+                result[key][player] += 1
+            time.sleep(1)
+        for player in range(n_players):
+            NAO_wins, player_wins = result['NAO_wins'][player], result['player_wins'][player]
+            result['winners'].append("NAO" if NAO_wins > player_wins else
+                                     "player" if player_wins > NAO_wins else "No one")
+            self.game.print_output(f"PLAYER {player + 1}: {NAO_wins}:{player_wins} for NAO, "
+                                   f"{result['winners'][player]} won")
+            self.say(f"Player {player + 1}, {NAO_wins}, {player_wins}!")
+        # NAO reacts to the outcome against the whole group
+        n_NAO, n_player = result['winners'].count("NAO"), result['winners'].count("player")
+        if n_NAO > n_player:
+            reaction = expressions[self.personality]["game outcome"]["NAO wins"]
+        elif n_player > n_NAO:
+            reaction = expressions[self.personality]["game outcome"]["player wins"]
+        else:
+            reaction = expressions[self.personality]["tie"]["1:1"]
+        self.game.log_event("reaction", kind="outcome", gesture=reaction["gesture"], speech=reaction["speech"])
+        if reaction["gesture"] is not None:
+            self.show_gesture(reaction["gesture"])
+        self.say(reaction["speech"])
+        self.game.log_event("game_end", result=result)
+        self.personal_goodbye()
+        self.change_eye_color("white")
+        self.show_gesture("BowShort_1")
+        return result
+
     def play_3_personalities(self, combination, say_instructions=True):
         """
         Conduct an experiment where the user plays a sequence of games with different robot personalities. The
@@ -473,37 +883,84 @@ class Robot:
         :param say_instructions: Whether to say instructions at the beginning of the experiment.
         :return: A dictionary containing the results for each personality.
         """
+        self.game.log_event("session_start", combination=combination, seed=self.game.schedule.seed)
+        n_sent, n_saved = self.commands.n_sent, self.commands.n_saved
+        self.game.print_output(f"*** Seed of NAO's throws: {self.game.schedule.seed} ***")
+        if self.use_camera and self.capture_frames:
+            from frame_archive import FrameArchive
+            self.color_detector.archive = FrameArchive(os.path.join(self.game.output_folder,
+                                                                    f"game_{self.game.n_game}.frames"))
         self.change_eye_color("white")
-        self.say(f"Hello, I'm {self.name}! Welcome to the experiment.")
+        self.say(WELCOME.format(name=self.name))
         ready = "repeat"
         final_result = {}
         while ready != "ready":
             if say_instructions:
                 self.say(instructions)
             ready = self.recognize_speech(["ready", "repeat"], use_mic=False, time_limit=8,
-                                          speech_button="If you understand the rules and are "
-                                                        "ready to begin the experiment,")
+                                          speech_button=BUTTON_READY)
         for i, personality in enumerate(combination):
             self.change_personality(personality)
             self.change_name(self.game.robots[personality]["name"])
+            self.game.events.start_game(i)
+            self.game.log_event("game_start", personality=personality, name=self.name)
             result = self.play_game()
             final_result[personality] = result
 
-            personality_result = [self.game.n_game] + [personality] + list(result.values())
-            with open('results.csv', 'a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(personality_result)
+            self.game.save_result(personality, result)
 
             if i + 1 < len(combination):
-                self.say("Now, please take a short survey about your gaming experience with my friend.")
+                self.say(ASK_SURVEY)
                 next_robot = "wait"
                 while next_robot != "next":
                     next_robot = self.recognize_speech(["next", "wait"], use_mic=False, time_limit=300,
-                                                       speech_button="After completing the survey, "
-                                                                     "to play with the next robot,")
-        self.say("Now, similarly, please take a survey about your gaming experience with my friend and "
-                 "thank you for participating in our experiment! "
-                 "After this survey, please also complete the final questionnaire. "
-                 "Your feedback is valuable to us!")
+                                                       speech_button=BUTTON_NEXT)
+        self.say(ASK_FINAL_SURVEY)
+        n_sent, n_saved = self.commands.n_sent - n_sent, self.commands.n_saved - n_saved
+        self.game.print_output(f"*** {n_sent} requests sent to NAO, {n_saved} round-trips saved ***")
+        self.game.log_event("session_end", seed=self.game.schedule.seed, throws=self.game.schedule.throws,
+                            requests_sent=n_sent, round_trips_saved=n_saved)
+        if self.use_camera and self.color_detector.archive is not None:
+            self.color_detector.archive.close()
+            self.game.print_output(f"*** Archived {self.color_detector.archive.n_frames} frames, "
+                                   f"{self.color_detector.archive.n_dropped} dropped ***")
+            self.color_detector.archive = None
 
         return final_result
+
+    def play_group_session(self, personality, n_players, n_rounds=3, say_instructions=True, tracker=None):
+        """
+        Conduct a session where a group of players plays one game against a robot personality at once. The instructor
+        robot explains the rules, the game is played (see play_group_game) and its result is stored with one row per
+        player in the group results CSV file.
+
+        :param personality: The personality to play with.
+        :param n_players: The number of players.
+        :param n_rounds: The number of rounds.
+        :param say_instructions: Whether to say instructions at the beginning of the session.
+        :param tracker: An optional signdetector.SignTracker, see recognize_player_colors.
+        :return: The result of the game, see play_group_game.
+        """
+        self.game.log_event("session_start", personality=personality, players=n_players,
+                            seed=self.game.schedule.seed)
+        n_sent, n_saved = self.commands.n_sent, self.commands.n_saved
+        self.game.print_output(f"*** Seed of NAO's throws: {self.game.schedule.seed} ***")
+        self.change_eye_color("white")
+        self.say(WELCOME.format(name=self.name))
+        ready = "repeat"
+        while ready != "ready":
+            if say_instructions:
+                self.say(instructions)
+            ready = self.recognize_speech(["ready", "repeat"], use_mic=False, time_limit=8,
+                                          speech_button=BUTTON_READY)
+        self.change_personality(personality)
+        self.change_name(self.game.robots[personality]["name"])
+        self.game.events.start_game(0)
+        self.game.log_event("game_start", personality=personality, name=self.name, players=n_players)
+        result = self.play_group_game(n_players, n_rounds, tracker=tracker)
+        self.game.save_group_result(personality, result)
+        n_sent, n_saved = self.commands.n_sent - n_sent, self.commands.n_saved - n_saved
+        self.game.print_output(f"*** {n_sent} requests sent to NAO, {n_saved} round-trips saved ***")
+        self.game.log_event("session_end", seed=self.game.schedule.seed, throws=self.game.schedule.throws,
+                            requests_sent=n_sent, round_trips_saved=n_saved)
+        return result
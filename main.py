@@ -1,5 +1,5 @@
-from sic_framework.services.dialogflow.dialogflow import RecognitionResult, QueryResult
 from game import Game, Robot
+from metrics import registry
 from itertools import product
 from random import shuffle
 import csv
@@ -20,27 +20,43 @@ def create_or_check_csv(csv_file: str):
                              'winner'])
 
 
-def run_experiment(mode: str, nao: str, use_mic=False, use_camera=False):
+def create_or_check_group_csv(csv_file: str):
     """
-    Runs the experiment for one participant. Each participant plays with one of the 4 combinations of robot
-    personalities, resulting in a game with 3 robots featuring different personalities (neutral, supportive,
-    competitive) in random order.
+    Create a CSV file to store the results of group sessions, one row per player, if it does not already exist.
 
-    :param mode: Either "desktop" or "robot".
-    :param nao: The IP address of the NAO robot.
-    :param use_mic: Use the (NAO or desktop) microphone. If True, say "yes" to start the game. If False and mode is set
-    to "robot", NAO's button is pressed to start the game. If False and mode is set to "desktop", type "yes" to start
-    the game (if use_camera is False) or the game will start automatically in 3 seconds (if use_camera is True).
-    :param use_camera: Use the (NAO or desktop) camera. If True, show one of the colored signs to the camera. If False,
-    type the color using the keyboard.
+    :param csv_file: Name of the CSV file in "file_name.csv" format.
+    """
+    if not os.path.isfile(csv_file):
+        with open(csv_file, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['session', 'personality', 'name', 'player', 'rounds', 'NAO_wins', 'player_wins', 'ties',
+                             'winner'])
+
+
+def get_combinations():
+    """
+    Get the 4 combinations of robot personalities: neutral, one of the 2 supportive and one of the 2 competitive
+    versions.
+
+    :return: A list of combinations, each a list of 3 personalities.
     """
     # 2 options for supportive, 2 for competitive robot
     supportive = [f"supportive{s + 1}" for s in range(2)]
     competitive = [f"competitive{s + 1}" for s in range(2)]
     prod = list(product(supportive, competitive))
-    combinations = [["neutral"] + list(comb) for comb in prod]
+    return [["neutral"] + list(comb) for comb in prod]
 
-    csv_file = 'results.csv'
+
+def allocate_subject(csv_file: str, reserved=()):
+    """
+    Get the ordinal number of the next participant and the combination of personalities (in random order) they will
+    play with.
+
+    :param csv_file: Name of the CSV file with the results of the previous participants.
+    :param reserved: Subjects that are already taken but have no results in the CSV file yet (e.g. running in another
+    booth).
+    :return: The subject number and the combination of personalities.
+    """
     create_or_check_csv(csv_file)
     with open(csv_file, 'r') as file:
         reader = csv.reader(file)
@@ -48,34 +64,147 @@ def run_experiment(mode: str, nao: str, use_mic=False, use_camera=False):
         existing_subjects = set(int(row[0]) for row in reader)
 
     # get the participant's ordinal number
-    max_subject = max(existing_subjects, default=0)
+    max_subject = max(existing_subjects | set(reserved), default=0)
     subject = max_subject + 1
 
     # get the ordinal number of a combination; each combination will be played,
     # and the number of repetitions of each combination will be (almost) equal
     n_combination = max_subject % 4
-    combination = combinations[n_combination]
+    combination = get_combinations()[n_combination]
 
     shuffle(combination)
+    return subject, combination
+
+
+def allocate_group_session(csv_file: str):
+    """
+    Get the ordinal number of the next group session and the personality the group will play with. The personalities
+    take turns, so each of them plays with (almost) as many groups.
+
+    :param csv_file: Name of the CSV file with the results of the previous group sessions.
+    :return: The session number and the personality.
+    """
+    create_or_check_group_csv(csv_file)
+    with open(csv_file, 'r') as file:
+        reader = csv.reader(file)
+        next(reader)
+        max_session = max((int(row[0]) for row in reader), default=0)
+    personalities = sorted(set(personality for combination in get_combinations() for personality in combination))
+    return max_session + 1, personalities[max_session % len(personalities)]
+
+
+def report_results(game: Game, subject: int, result: dict):
+    """
+    Write the final results of all games of one participant to the output.
+
+    :param game: The Game instance of the participant.
+    :param subject: The participant's ordinal number.
+    :param result: The dictionary with the results for each personality returned by Robot.play_3_personalities.
+    """
+    game.print_output(f"Final results for game №{subject}:")
+    game.print_output(f"seed: {game.schedule.seed}")
+    for personality in list(result.keys()):
+        game.print_output(f"--- Personality: {personality} ---")
+        for key in result[personality].keys():
+            game.print_output(f"{key}: {result[personality][key]}")
+
+
+def run_experiment(mode: str, nao: str, use_mic=False, use_camera=False, seed=None, capture_frames=False,
+                   metrics_port=None, use_tts_cache=False, lut_file=None, detection_processes=False):
+    """
+    Runs the experiment for one participant. Each participant plays with one of the 4 combinations of robot
+    personalities, resulting in a game with 3 robots featuring different personalities (neutral, supportive,
+    competitive) in random order.
+
+    :param mode: Either "desktop" or "robot".
+    :param nao: The IP address of the NAO robot.
+    :param use_mic: Use the (NAO or desktop) microphone. If True, say "yes" to start the game. If False and mode is set
+    to "robot", NAO's button is pressed to start the game. If False and mode is set to "desktop", type "yes" to start
+    the game (if use_camera is False) or the game will start automatically in 3 seconds (if use_camera is True).
+    :param use_camera: Use the (NAO or desktop) camera. If True, show one of the colored signs to the camera. If False,
+    type the color using the keyboard.
+    :param seed: The seed of NAO's throws, e.g. to replay a session; a new random seed is chosen if None.
+    :param capture_frames: Archive the camera frames used for detection in "output/game_N.frames.npy".
+    :param metrics_port: Serve the live metrics of the detector and the robot on http://127.0.0.1:<port>/metrics; they
+    are also written to "output/metrics.txt" every 5 seconds.
+    :param use_tts_cache: Play NAO's fixed utterances from the cache built with "python tts_cache.py --nao <IP>" instead
+    of synthesizing them during the session. Only in "robot" mode; on the desktop the speech is printed, not played.
+    :param lut_file: Classify the signs with the color table built with "python color_lut.py" (e.g. "color_lut.npy")
+    instead of the color thresholds.
+    :param detection_processes: Run the sign detection in worker processes (see detection_pool.ProcessDetectionPool),
+    so it doesn't hold up the game loop.
+    """
+    csv_file = 'results.csv'
+    subject, combination = allocate_subject(csv_file)
 
     # create the "output" folder if it doesn't exist
     output_folder = "output"
     os.makedirs(output_folder, exist_ok=True)
+    if metrics_port is not None:
+        registry.serve(metrics_port)
+    registry.write_periodically(os.path.join(output_folder, "metrics.txt"))
+
+    rock_paper_scissors_game = Game(n_game=subject, seed=seed, output_folder=output_folder)
+    tts_cache = None
+    if use_tts_cache and mode == "robot":
+        from tts_cache import NaoEngine, UtteranceCache
+        tts_cache = UtteranceCache(NaoEngine(nao))
+
+    detection_pool = None
+    if use_camera and detection_processes:
+        from color_lut import load_lut
+        from detection_pool import ProcessDetectionPool
+        detection_pool = ProcessDetectionPool(lut=load_lut(lut_file) if lut_file is not None else None)
+
+    try:
+        robot = Robot(ip=nao,
+                      game=rock_paper_scissors_game,
+                      mode=mode,
+                      use_mic=use_mic,
+                      use_camera=use_camera,
+                      detection_pool=detection_pool,
+                      capture_frames=capture_frames,
+                      tts_cache=tts_cache,
+                      lut_file=lut_file)
+        result = robot.play_3_personalities(combination, say_instructions=True)
+        report_results(rock_paper_scissors_game, subject, result)
+    finally:
+        if detection_pool is not None:
+            detection_pool.shutdown()
+
+
+def run_group_session(mode: str, nao: str, n_players: int, n_rounds=3, use_mic=False, use_camera=False, seed=None,
+                      personality=None, output_folder="output/group", lut_file=None):
+    """
+    Runs a session for a group of players, standing side by side in front of the camera, who play a game against one
+    robot personality at once (see Robot.play_group_session). The results are stored in "group_results.csv", and the
+    logs of the group sessions are kept apart from those of the participants of the experiment, as they are numbered
+    separately.
 
-    rock_paper_scissors_game = Game(n_game=subject)
+    :param mode: Either "desktop" or "robot".
+    :param nao: The IP address of the NAO robot.
+    :param n_players: The number of players.
+    :param n_rounds: The number of rounds of the game.
+    :param use_mic: Use the (NAO or desktop) microphone, see run_experiment.
+    :param use_camera: Use the (NAO or desktop) camera. If False, type the color of every player using the keyboard.
+    :param seed: The seed of NAO's throws, e.g. to replay a session; a new random seed is chosen if None.
+    :param personality: The personality to play with; by default the personalities take turns.
+    :param output_folder: The folder for the logs of the group sessions.
+    :param lut_file: Classify the signs with a color table, see run_experiment.
+    """
+    csv_file = 'group_results.csv'
+    session, next_personality = allocate_group_session(csv_file)
+    os.makedirs(output_folder, exist_ok=True)
 
+    group_game = Game(n_game=session, seed=seed, output_folder=output_folder)
     robot = Robot(ip=nao,
-                  game=rock_paper_scissors_game,
+                  game=group_game,
                   mode=mode,
                   use_mic=use_mic,
-                  use_camera=use_camera)
-    result = robot.play_3_personalities(combination, say_instructions=True)
-
-    rock_paper_scissors_game.print_output(f"Final results for game №{subject}:")
-    for personality in list(result.keys()):
-        rock_paper_scissors_game.print_output(f"--- Personality: {personality} ---")
-        for key in result[personality].keys():
-            rock_paper_scissors_game.print_output(f"{key}: {result[personality][key]}")
+                  use_camera=use_camera,
+                  lut_file=lut_file)
+    result = robot.play_group_session(personality or next_personality, n_players, n_rounds)
+    report_results(group_game, session, {robot.personality: result})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,185 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import bisect
+import time
+import os
+
+
+class Counter:
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return [f"{self.name} {self.value}"]
+
+
+class Gauge:
+    def __init__(self, name, description, function=None):
+        """
+        :param name: The name of the gauge.
+        :param description: What the gauge measures.
+        :param function: Optional function that returns the current value, e.g. the size of a queue; it is called
+        whenever the metrics are read.
+        """
+        self.name = name
+        self.description = description
+        self.function = function
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def render(self):
+        value = self.function() if self.function is not None else self.value
+        return [f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name, description, buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        """
+        :param name: The name of the histogram.
+        :param description: What the histogram measures.
+        :param buckets: The upper bounds of the buckets, in seconds for durations.
+        """
+        self.name = name
+        self.description = description
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """
+        Measure the duration of a block: with histogram.time(): ...
+        """
+        return _Timer(self)
+
+    def render(self):
+        lines = []
+        cumulative = 0
+        for bucket, count in zip(self.buckets + ["+Inf"], self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bucket}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum:.6f}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        A registry of the metrics of the process. A metric is created on first use and shared afterwards, so every
+        module can ask for it by name. The metrics can be read as text in the Prometheus format, over a local HTTP
+        endpoint or from a file that is written periodically.
+        """
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, description, **kwargs):
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, description, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, description=""):
+        return self._get(Counter, name, description)
+
+    def gauge(self, name, description="", function=None):
+        gauge = self._get(Gauge, name, description)
+        if function is not None:
+            gauge.set_function(function)
+        return gauge
+
+    def histogram(self, name, description="", **kwargs):
+        return self._get(Histogram, name, description, **kwargs)
+
+    def render(self):
+        """
+        Get the current values of all metrics as text.
+
+        :return: The metrics in the Prometheus text format.
+        """
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            if metric.description:
+                lines.append(f"# HELP {name} {metric.description}")
+            lines.append(f"# TYPE {name} {type(metric).__name__.lower()}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9108, host="127.0.0.1"):
+        """
+        Serve the metrics over HTTP (e.g. http://127.0.0.1:9108/metrics) from a background thread.
+
+        :param port: The port to listen on.
+        :param host: The address to listen on; keep it local.
+        :return: The HTTP server.
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # don't mix the requests into the output of the game
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def write_periodically(self, path="output/metrics.txt", interval=5.0):
+        """
+        Write the metrics to a file every *interval* seconds from a background thread.
+
+        :param path: The file to write.
+        :param interval: The interval in seconds.
+        """
+        def write():
+            while True:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                tmp_path = path + ".tmp"
+                with open(tmp_path, 'w') as file:
+                    file.write(self.render())
+                os.replace(tmp_path, path)
+                time.sleep(interval)
+
+        threading.Thread(target=write, name="metrics-file", daemon=True).start()
+
+
+# the registry of this process
+registry = MetricsRegistry()
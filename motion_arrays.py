@@ -0,0 +1,138 @@
+import numpy as np
+import struct
+import json
+
+# file layout: magic, header length, JSON header with the joint names, then float32 rows [time, angle per joint]
+MAGIC = b"NAOMOTN1"
+HEADER_LENGTH = struct.Struct("<I")
+
+
+class MotionWriter:
+    def __init__(self, path, joints):
+        """
+        Write a motion incrementally in the compact array format: every recorded frame is one row of float32 values
+        (the time and one angle per joint) appended to the file, so nothing is lost if the recording is interrupted.
+
+        :param path: The path of the file, e.g. "recorded_motions/rock.frames".
+        :param joints: The names of the recorded joints (e.g. "RShoulderPitch"), in the order of the angles.
+        """
+        self.path = path
+        self.joints = list(joints)
+        header = json.dumps({"joints": self.joints}).encode()
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+        self.n_frames = 0
+
+    def append(self, times, angles):
+        """
+        Append frames to the file.
+
+        :param times: The times of the frames in seconds, shape (n_frames,).
+        :param angles: The angles of the frames, shape (n_frames, n_joints).
+        """
+        rows = np.column_stack([np.asarray(times, dtype=np.float32), np.asarray(angles, dtype=np.float32)])
+        self.file.write(rows.tobytes())
+        self.file.flush()
+        self.n_frames += len(rows)
+
+    def close(self):
+        self.file.close()
+
+
+def save_motion(path, joints, times, angles):
+    """
+    Save a whole motion in the compact array format.
+
+    :param path: The path of the file.
+    :param joints: The names of the joints.
+    :param times: The times of the frames, shape (n_frames,).
+    :param angles: The angles of the frames, shape (n_frames, n_joints).
+    """
+    writer = MotionWriter(path, joints)
+    writer.append(times, angles)
+    writer.close()
+
+
+def load_motion(path):
+    """
+    Load a motion saved in the compact array format.
+
+    :param path: The path of the file.
+    :return: The joint names, the times (n_frames,) and the angles (n_frames, n_joints).
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a motion in the compact array format")
+        header_length, = HEADER_LENGTH.unpack(file.read(HEADER_LENGTH.size))
+        joints = json.loads(file.read(header_length))["joints"]
+        data = np.frombuffer(file.read(), dtype=np.float32)
+    # ignore a row that was being written when the recording stopped
+    n_columns = len(joints) + 1
+    rows = data[:len(data) - len(data) % n_columns].reshape(-1, n_columns)
+    return joints, rows[:, 0], rows[:, 1:]
+
+
+def still_since(times, angles, tolerance=0.02):
+    """
+    Get the time since which all joints have been still.
+
+    :param times: The times of the frames, shape (n_frames,).
+    :param angles: The angles of the frames, shape (n_frames, n_joints).
+    :param tolerance: The largest change of a joint angle (in radians) that still counts as not moving.
+    :return: The time of the first frame of the still period at the end of the motion.
+    """
+    if len(times) == 0:
+        return 0.0
+    # a frame is still if no joint is further than the tolerance from its position in the last frame
+    moving = np.abs(angles - angles[-1]).max(axis=1) > tolerance
+    if not moving.any():
+        return float(times[0])
+    # the last frame is never moving, so there is always a frame after the last moving one
+    return float(times[np.flatnonzero(moving)[-1] + 1])
+
+
+def trim_idle(times, angles, tolerance=0.02, margin=0.3):
+    """
+    Cut the frames at the start and at the end of a motion where the robot doesn't move.
+
+    :param times: The times of the frames, shape (n_frames,).
+    :param angles: The angles of the frames, shape (n_frames, n_joints).
+    :param tolerance: The largest change of a joint angle (in radians) that still counts as not moving.
+    :param margin: The time in seconds kept before the first and after the last movement.
+    :return: The trimmed times and angles. The times start one frame after 0, as NAO can't reach a position at 0.
+    """
+    if len(times) < 2:
+        return times, angles
+    moving = np.flatnonzero(np.abs(np.diff(angles, axis=0)).max(axis=1) > tolerance)
+    if len(moving) == 0:
+        return times[:1] - times[0] + (times[1] - times[0]), angles[:1]
+    start = np.searchsorted(times, times[moving[0]] - margin)
+    end = np.searchsorted(times, times[moving[-1] + 1] + margin, side='right')
+    return times[start:end] - times[start] + (times[1] - times[0]), angles[start:end]
+
+
+def to_recording(joints, times, angles):
+    """
+    Convert a motion to a sic_framework recording that NAO can play.
+
+    :param joints: The names of the joints.
+    :param times: The times of the frames, shape (n_frames,).
+    :param angles: The angles of the frames, shape (n_frames, n_joints).
+    :return: A NaoqiMotionRecording.
+    """
+    from sic_framework.devices.common_naoqi.naoqi_motion_recorder import NaoqiMotionRecording
+    # the recording keeps a list of angles and a list of times per joint
+    recorded_times = [times.tolist()] * len(joints)
+    return NaoqiMotionRecording(list(joints), angles.T.tolist(), recorded_times)
+
+
+def from_recording(recording):
+    """
+    Convert a sic_framework recording to arrays.
+
+    :param recording: A NaoqiMotionRecording.
+    :return: The joint names, the times (n_frames,) and the angles (n_frames, n_joints).
+    """
+    angles = np.array(recording.recorded_angles, dtype=np.float32).T
+    times = np.array(recording.recorded_times[0], dtype=np.float32)
+    return list(recording.recorded_joints), times, angles
@@ -0,0 +1,170 @@
+from game import Game, Robot
+from main import allocate_subject, create_or_check_csv, report_results
+from signdetector import DetectionPool
+from metrics import registry
+import threading
+import time
+import csv
+import os
+
+
+class SharedLogSink:
+    def __init__(self, output_folder="output"):
+        """
+        A logging sink shared by all booths. It keeps one open txt file per game and serializes the writes, so lines
+        of different booths never interleave within a line.
+
+        :param output_folder: The folder with the "game_N.txt" files.
+        """
+        self.output_folder = output_folder
+        os.makedirs(self.output_folder, exist_ok=True)
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def write(self, n_game, output):
+        """
+        Write the output to the txt file of the game.
+
+        :param n_game: The number of the game.
+        :param output: The output to write.
+        """
+        with self._lock:
+            file = self._files.get(n_game)
+            if file is None:
+                file = open(os.path.join(self.output_folder, f"game_{n_game}.txt"), 'a')
+                self._files[n_game] = file
+            file.write('\n' + output)
+            file.flush()
+
+    def close(self):
+        with self._lock:
+            for file in self._files.values():
+                file.close()
+            self._files.clear()
+
+
+class ResultsStore:
+    def __init__(self, csv_file="results.csv"):
+        """
+        A results store shared by all booths. It allocates the subject numbers and writes the rows of the results
+        CSV file one at a time.
+
+        :param csv_file: Name of the CSV file in "file_name.csv" format.
+        """
+        self.csv_file = csv_file
+        create_or_check_csv(self.csv_file)
+        self._reserved = set()
+        self._lock = threading.Lock()
+
+    def allocate(self):
+        """
+        Allocate the next participant. Subjects that are still playing in another booth are taken into account, so
+        every booth gets its own subject and the combinations stay balanced.
+
+        :return: The subject number and the combination of personalities.
+        """
+        with self._lock:
+            subject, combination = allocate_subject(self.csv_file, reserved=self._reserved)
+            self._reserved.add(subject)
+        return subject, combination
+
+    def write_row(self, row):
+        """
+        Append a row to the results CSV file.
+
+        :param row: The row to write.
+        """
+        with self._lock:
+            with open(self.csv_file, 'a', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(row)
+
+
+class BoothOrchestrator:
+    def __init__(self, booths, csv_file="results.csv", output_folder="output", detection_workers=None,
+                 metrics_port=None, detection_processes=False):
+        """
+        Run the experiment in several booths at once in one process, with one thread per booth. All booths share the
+        detection worker pool, the results store and the logging sink.
+
+        :param booths: A list of booth configurations, each a dictionary with the arguments of main.run_experiment
+        ("mode", "nao", "use_mic", "use_camera", "capture_frames", "lut_file").
+        :param csv_file: Name of the CSV file for the results.
+        :param output_folder: The folder for the txt and event logs, the archived frames and the metrics.
+        :param detection_workers: The number of detection threads; by default one per booth, so the detection latency
+        of a booth stays the same when booths are added.
+        :param metrics_port: Serve the live metrics of all booths on this local port (see main.run_experiment).
+        :param detection_processes: Run the detection in worker processes (see detection_pool.ProcessDetectionPool)
+        instead of threads, so it doesn't hold up the booths' game loops and uses several cores.
+        """
+        self.booths = booths
+        self.results_store = ResultsStore(csv_file)
+        self.log_sink = SharedLogSink(output_folder)
+        if detection_processes:
+            from color_lut import load_lut
+            from detection_pool import ProcessDetectionPool
+            # the workers get the color table of the booths once; a booth with another table sends it with its frames
+            lut_files = [booth["lut_file"] for booth in booths if booth.get("lut_file") is not None]
+            self.detection_pool = ProcessDetectionPool(max_workers=detection_workers or len(booths),
+                                                       lut=load_lut(lut_files[0]) if lut_files else None)
+        else:
+            self.detection_pool = DetectionPool(max_workers=detection_workers or len(booths))
+        if metrics_port is not None:
+            registry.serve(metrics_port)
+        registry.write_periodically(os.path.join(output_folder, "metrics.txt"))
+        self.results = {}
+        self.durations = {}
+        self.errors = {}
+
+    def run_booth(self, n_booth, booth):
+        """
+        Run the experiment for one participant in one booth.
+
+        :param n_booth: The number of the booth.
+        :param booth: The booth configuration.
+        """
+        start_time = time.time()
+        try:
+            subject, combination = self.results_store.allocate()
+            game = Game(n_game=subject, log_sink=self.log_sink, results_store=self.results_store,
+                        output_folder=self.log_sink.output_folder)
+            game.print_output(f"*** Booth {n_booth}: subject {subject} ***")
+            robot = Robot(ip=booth["nao"],
+                          game=game,
+                          mode=booth.get("mode", "robot"),
+                          use_mic=booth.get("use_mic", False),
+                          use_camera=booth.get("use_camera", True),
+                          detection_pool=self.detection_pool,
+                          capture_frames=booth.get("capture_frames", False),
+                          lut_file=booth.get("lut_file"))
+            result = robot.play_3_personalities(combination, say_instructions=True)
+            report_results(game, subject, result)
+            self.results[n_booth] = result
+        except Exception as e:
+            # one failing booth must not stop the sessions in the other booths
+            self.errors[n_booth] = e
+            print(f"Booth {n_booth} failed: {e!r}")
+        self.durations[n_booth] = time.time() - start_time
+
+    def run(self):
+        """
+        Run all booths in parallel and wait for them to finish.
+
+        :return: A dictionary with the results for each booth.
+        """
+        threads = [threading.Thread(target=self.run_booth, args=(n_booth, booth), name=f"booth-{n_booth}")
+                   for n_booth, booth in enumerate(self.booths)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for n_booth, duration in sorted(self.durations.items()):
+            print(f"Booth {n_booth} finished in {duration:.1f} seconds")
+        self.detection_pool.shutdown()
+        self.log_sink.close()
+        return self.results
+
+
+if __name__ == '__main__':
+    BoothOrchestrator([{"mode": "robot", "nao": "10.0.0.91", "use_mic": False, "use_camera": True},
+                       {"mode": "robot", "nao": "10.0.0.89", "use_mic": False, "use_camera": True}]).run()
@@ -1,48 +1,149 @@
 from sic_framework.devices import Nao
-from sic_framework.devices.common_naoqi.naoqi_text_to_speech import NaoqiTextToSpeechRequest
 import time
 from sic_framework.devices.common_naoqi.naoqi_stiffness import Stiffness
-from sic_framework.devices.common_naoqi.common_naoqi_motion import NaoqiMotionTools
-from sic_framework.devices.common_naoqi.naoqi_motion_recorder import NaoqiMotionRecorder, StartRecording, StopRecording, \
-    PlayRecording, NaoqiMotionRecorderConf
+from sic_framework.devices.common_naoqi.naoqi_motion_recorder import StartRecording, StopRecording, PlayRecording
+from sic_framework.devices.common_naoqi.naoqi_motion_streamer import (NaoqiMotionStreamerConf, StartStreaming,
+                                                                      StopStreaming)
+from motion_arrays import MotionWriter, from_recording, load_motion, save_motion, still_since, to_recording, trim_idle
+import numpy as np
+import threading
+import sys
 
 # conf = NaoqiMotionRecorderConf(use_sensors=True)
 
 # recorder = NaoqiMotionRecorder("192.168.0.242", conf=conf)
 joints = ['RArm', 'LArm', 'Head']
 
-nao = Nao(ip="10.0.0.89")
-NaoqiMotionRecorderConf(replay_speed=0.5)
 
-recordings = [
-    'comp_lose',
-    'supp_win',
-    'supp_lose',
-]
+class StillnessMonitor:
+    def __init__(self, tolerance=0.02):
+        """
+        Watch the joint angles streamed by NAO's motion streamer to tell when the robot has been moved and is kept
+        still again, and write them to a file as they arrive. The stream is separate from the recording, so the
+        recording itself is never interrupted.
 
-for each in recordings:
-    nao.stiffness.request(Stiffness(0.0, joints))
-    time.sleep(2)
-    print('Now recording the motion: ' + str(each))
+        :param tolerance: The largest change of a joint angle (in radians) that still counts as not moving.
+        """
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        self.path = None
+        self.writer = None
+        self.reset()
 
+    def reset(self, path=None):
+        """
+        Start watching a new motion.
+
+        :param path: The file the streamed angles are appended to (see motion_arrays.MotionWriter), if any.
+        """
+        self.close()
+        with self._lock:
+            self.times = []
+            self.angles = []
+            self.path = path
+
+    def on_angles(self, message):
+        with self._lock:
+            self.times.append(time.time())
+            self.angles.append(list(message.angles))
+            if self.path is not None:
+                if self.writer is None:
+                    self.writer = MotionWriter(self.path, message.joints)
+                self.writer.append([self.times[-1] - self.times[0]], [self.angles[-1]])
+
+    def close(self):
+        with self._lock:
+            if self.writer is not None:
+                self.writer.close()
+            self.writer = None
+            self.path = None
+
+    def state(self):
+        """
+        :return: Whether the robot has been moved, and for how long (in seconds) it has been still.
+        """
+        with self._lock:
+            if len(self.times) < 2:
+                return False, 0.0
+            times = np.array(self.times)
+            since = still_since(times, np.array(self.angles, dtype=np.float32), self.tolerance)
+        return bool(since > times[0]), float(times[-1] - since)
+
+
+def record_motion(nao, name, joints, monitor, still_time=2.0, max_time=15):
+    """
+    Record a motion in one continuous recording and save it to "recorded_motions/<name>.frames". The joint angles are
+    watched through the motion streamer and appended to the file as they arrive, so the motion isn't lost if the
+    recording is interrupted; the recording stops once the robot has been moved and then kept still for *still_time*
+    seconds, and then replaces the streamed angles in the file.
+
+    :param nao: The Nao device.
+    :param name: The name of the motion.
+    :param joints: The joint chains to record, e.g. ['RArm', 'LArm', 'Head'].
+    :param monitor: The StillnessMonitor registered on the motion streamer.
+    :param still_time: How long (in seconds) the joints have to be still to stop the recording.
+    :param max_time: The recording stops after this many seconds in any case.
+    :return: The path of the frames file.
+    """
+    path = 'recorded_motions/' + name + '.frames'
+    monitor.reset(path)
     nao.motion_record.request(StartRecording(joints))
-    
-    
-    print("Start moving the robot!")
+    nao.motion_streaming.request(StartStreaming(joints))
+    start_time = time.time()
+    while time.time() - start_time < max_time:
+        time.sleep(0.1)
+        moved, still = monitor.state()
+        if moved and still >= still_time:
+            break
+    nao.motion_streaming.request(StopStreaming())
+    monitor.close()
+    recorded_joints, times, angles = from_recording(nao.motion_record.request(StopRecording()))
+    save_motion(path, recorded_joints, times, angles)
+    print(f"Recorded {name}: {len(times)} frames in {time.time() - start_time:.1f} seconds")
+    return path
+
 
-    record_time = 15
+def record_motions(nao, names, joints, still_time=2.0, tolerance=0.02, replay=True):
+    """
+    Record a list of motions in one session. Every motion is trimmed to the part where the robot moves and saved as
+    "recorded_motions/<name>.frames" and as "recorded_motions/<name>.motion" (the format game.py plays).
 
-    time.sleep(record_time)
+    :param nao: The Nao device.
+    :param names: The names of the motions.
+    :param joints: The joint chains to record.
+    :param still_time: How long (in seconds) the joints have to be still to stop a recording.
+    :param tolerance: The largest change of a joint angle (in radians) that still counts as not moving.
+    :param replay: Whether to play every motion after recording it.
+    """
+    monitor = StillnessMonitor(tolerance)
+    nao.motion_streaming.register_callback(monitor.on_angles)
+    for each in names:
+        nao.stiffness.request(Stiffness(0.0, joints))
+        time.sleep(2)
+        print('Now recording the motion: ' + str(each))
+        print("Start moving the robot!")
+        path = record_motion(nao, each, joints, monitor, still_time=still_time)
+        print("Done")
+        nao.stiffness.request(Stiffness(0.6, joints))
 
-    recording = nao.motion_record.request(StopRecording())
-    print("Done")
-    nao.stiffness.request(Stiffness(0.6, joints))
-    print(recording)
-    print('Now playing the recording: ' + str(each))
-    time.sleep(5)
-    nao.motion_record.request(PlayRecording(recording))
-    time.sleep(5)
-    print('Saving the recording ' + str(each))
+        recorded_joints, times, angles = load_motion(path)
+        times, angles = trim_idle(times, angles, tolerance)
+        save_motion(path, recorded_joints, times, angles)
+        recording = to_recording(recorded_joints, times, angles)
+        if replay:
+            print('Now playing the recording: ' + str(each))
+            nao.motion_record.request(PlayRecording(recording), block=True)
+        print('Saving the recording ' + str(each))
+        recording.save('recorded_motions/' + str(each) + '.motion')
 
 
-    recording.save('recorded_motions/' + str(each) + '.motion')
\ No newline at end of file
+if __name__ == '__main__':
+    # the streamer only reads the joints here, it must not stiffen them while the robot is moved by hand
+    nao = Nao(ip="10.0.0.89", motion_stream_conf=NaoqiMotionStreamerConf(stiffness=0.0, samples_per_second=20))
+    # e.g. python record_motions.py rock2 paper2 scissors2
+    recordings = sys.argv[1:] or [
+        'comp_lose',
+        'supp_win',
+        'supp_lose',
+    ]
+    record_motions(nao, recordings, joints)
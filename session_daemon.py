@@ -0,0 +1,155 @@
+from game import Game, Robot
+from main import allocate_subject, report_results
+from metrics import registry
+import socketserver
+import socket
+import threading
+import time
+import sys
+import os
+
+HOST = "127.0.0.1"
+PORT = 8642
+
+
+class SessionDaemon:
+    def __init__(self, mode: str, nao: str, use_mic=False, use_camera=False, csv_file="results.csv",
+                 capture_frames=False, metrics_port=None, output_folder="output", lut_file=None):
+        """
+        A long-running session service. The robot, the color detector and the Dialogflow connection are created once
+        and kept alive, and every participant is started with a local control command instead of a new process.
+
+        :param mode: Either "desktop" or "robot".
+        :param nao: The IP address of the NAO robot.
+        :param use_mic: Use the (NAO or desktop) microphone (see main.run_experiment).
+        :param use_camera: Use the (NAO or desktop) camera (see main.run_experiment).
+        :param csv_file: Name of the CSV file for the results.
+        :param capture_frames: Archive the camera frames used for detection (see main.run_experiment).
+        :param metrics_port: Serve the live metrics on this local port (see main.run_experiment).
+        :param output_folder: The folder for the logs, the archived frames and the metrics.
+        :param lut_file: Classify the signs with a color table (see main.run_experiment).
+        """
+        self.csv_file = csv_file
+        self.output_folder = output_folder
+        self.subject = None
+        self.session_thread = None
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+
+        os.makedirs(output_folder, exist_ok=True)
+        if metrics_port is not None:
+            registry.serve(metrics_port)
+        registry.write_periodically(os.path.join(output_folder, "metrics.txt"))
+        start_time = time.time()
+        # the game of the first participant is not known yet, the robot gets it when the session starts
+        self.robot = Robot(ip=nao,
+                           game=Game(n_game=0, output_folder=output_folder),
+                           mode=mode,
+                           use_mic=use_mic,
+                           use_camera=use_camera,
+                           capture_frames=capture_frames,
+                           lut_file=lut_file)
+        print(f"Devices are ready in {time.time() - start_time:.1f} seconds")
+
+    def start_session(self):
+        """
+        Start the experiment for the next participant in the background.
+
+        :return: The subject number, or None if a session is still running.
+        """
+        with self._lock:
+            if self.session_thread is not None and self.session_thread.is_alive():
+                return None
+            subject, combination = allocate_subject(self.csv_file)
+            self.subject = subject
+            self.session_thread = threading.Thread(target=self.run_session, args=(subject, combination),
+                                                   name=f"session-{subject}")
+            self.session_thread.start()
+        return subject
+
+    def run_session(self, subject, combination):
+        """
+        Run the experiment for one participant with the devices that are already connected.
+
+        :param subject: The participant's ordinal number.
+        :param combination: The combination of personalities.
+        """
+        start_time = time.time()
+        game = Game(n_game=subject, output_folder=self.output_folder)
+        self.robot.change_game(game)
+        self.robot.change_name("NAO")
+        self.robot.change_personality("neutral")
+        try:
+            result = self.robot.play_3_personalities(combination, say_instructions=True)
+            report_results(game, subject, result)
+        except Exception as e:
+            print(f"Session of subject {subject} failed: {e!r}")
+        print(f"Session of subject {subject} finished in {time.time() - start_time:.1f} seconds")
+
+    def status(self):
+        if self.session_thread is not None and self.session_thread.is_alive():
+            return f"running subject {self.subject}"
+        return "idle"
+
+    def handle_command(self, command):
+        """
+        Handle a control command.
+
+        :param command: "next" to start the next participant, "status" or "stop".
+        :return: The reply to send back.
+        """
+        if command == "next":
+            subject = self.start_session()
+            if subject is None:
+                return f"busy: {self.status()}"
+            return f"started subject {subject}"
+        elif command == "status":
+            return self.status()
+        elif command == "stop":
+            self.stopped.set()
+            return "stopping after the current session"
+        return f"unknown command: {command}"
+
+    def serve(self, host=HOST, port=PORT):
+        """
+        Listen for control commands on a local TCP port until the "stop" command.
+
+        :param host: The address to listen on; keep it local.
+        :param port: The port to listen on.
+        """
+        daemon = self
+
+        class CommandHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                command = self.rfile.readline().decode().strip()
+                self.wfile.write((daemon.handle_command(command) + "\n").encode())
+
+        with socketserver.ThreadingTCPServer((host, port), CommandHandler) as server:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            print(f"Waiting for commands on {host}:{port}, e.g. 'python session_daemon.py next'")
+            self.stopped.wait()
+            server.shutdown()
+        if self.session_thread is not None:
+            self.session_thread.join()
+
+
+def send_command(command, host=HOST, port=PORT):
+    """
+    Send a control command to a running session daemon.
+
+    :param command: "next", "status" or "stop".
+    :param host: The address of the daemon.
+    :param port: The port of the daemon.
+    :return: The reply of the daemon.
+    """
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall((command + "\n").encode())
+        return connection.makefile().readline().strip()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] != "serve":
+        print(send_command(sys.argv[1]))
+    else:
+        SessionDaemon(mode="robot", nao="10.0.0.91", use_mic=False, use_camera=True).serve()
@@ -1,12 +1,20 @@
+import collections
 import inspect
-import queue
+import math
+import sys
+import threading
 import time
+from concurrent.futures.process import BrokenProcessPool
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import TYPE_CHECKING
 
 import cv2
 import numpy as np
-from sic_framework.core.message_python2 import CompressedImageMessage
-from sic_framework.devices import Nao
-from sic_framework.devices.desktop import Desktop
+from color_lut import classify_region
+from metrics import registry
+
+if TYPE_CHECKING:
+    from sic_framework.core.message_python2 import CompressedImageMessage
 
 
 def correct_white_balance(img, reference_area):
@@ -45,11 +53,7 @@ def detect_features(img, min_area, max_area, min_circularity, min_convexity):
     detector = cv2.SimpleBlobDetector_create(params)
 
     # Detect blobs
-    keypoints = detector.detect(gray_blurred)
-    output_blobs = cv2.drawKeypoints(img, keypoints, np.array([]), (0, 0, 255),
-                                     cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS)
-
-    return output_blobs, keypoints
+    return detector.detect(gray_blurred)
 
 
 def get_default_args(func):
@@ -61,11 +65,33 @@ def get_default_args(func):
     }
 
 
+# a detected sign: its color, the center and diameter of the blob in pixels, and how clearly it passed the thresholds
+# (0 at the thresholds, towards 1 far above them)
+Detection = collections.namedtuple("Detection", ["color", "x", "y", "size", "confidence"])
+
+
 def get_colors(img, min_area=220, max_area=100000, min_circularity=0.8, min_convexity=0.8,
-               ratio_threshold=0.6, saturation_threshold=120, draw=True, fix_white_balance=True):
-    output_blobs, keypoints = detect_features(img, min_area, max_area, min_circularity, min_convexity)
+               ratio_threshold=0.6, saturation_threshold=120, overlay=None, fix_white_balance=True, lut=None):
+    detections = get_detections(img, min_area, max_area, min_circularity, min_convexity, ratio_threshold,
+                                saturation_threshold, overlay, fix_white_balance, lut)
+    return [detection.color for detection in detections]
+
 
-    dominant_colors = []
+def get_detections(img, min_area=220, max_area=100000, min_circularity=0.8, min_convexity=0.8,
+                   ratio_threshold=0.6, saturation_threshold=120, overlay=None, fix_white_balance=True, lut=None):
+    """
+    Detect the colored signs in an image, see get_colors for the parameters. If a color table (see color_lut) is given,
+    the blobs are classified by looking up their pixels in it, and the thresholds are not used. If an *overlay* is
+    given (an image of the same size, e.g. a reused copy of img), the blobs and their colors are drawn on it.
+
+    :return: A list of Detection.
+    """
+    keypoints = detect_features(img, min_area, max_area, min_circularity, min_convexity)
+    if overlay is not None:
+        cv2.drawKeypoints(img, keypoints, overlay, (0, 0, 255),
+                          cv2.DRAW_MATCHES_FLAGS_DRAW_OVER_OUTIMG | cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS)
+
+    detections = []
 
     for keypoint in keypoints:
         x, y = int(keypoint.pt[0]), int(keypoint.pt[1])
@@ -87,8 +113,8 @@ def get_colors(img, min_area=220, max_area=100000, min_circularity=0.8, min_conv
         reference_area = img[ref_y1:ref_y2, ref_x1:ref_x2]
 
         # draw white balance ref. area
-        cv2.rectangle(output_blobs, (ref_x1, ref_y1), (ref_x2, ref_y2), (255, 0, 0),
-                      1)  # Small red circle at the center
+        if overlay is not None:
+            cv2.rectangle(overlay, (ref_x1, ref_y1), (ref_x2, ref_y2), (255, 0, 0), 1)
 
         # Correct white balance of the blob region
         corrected_blob_region = correct_white_balance(blob_region, reference_area)
@@ -99,148 +125,537 @@ def get_colors(img, min_area=220, max_area=100000, min_circularity=0.8, min_conv
 
         # Rest of your code for displaying the color information...
 
-        # Calculate the ratio of the brightest color to the sum of the other two colors
-        max_color = max(blob_color)
-        sum_other_colors = sum(blob_color) - max_color
-
         dominant_color = ""
-        color_ratio = max_color / sum_other_colors if sum_other_colors > 0 else 0  # Avoid division by zero
+        confidence = 0.0
+        if lut is not None:
+            # one table lookup per pixel instead of the ratio and the HSV conversion below
+            region = corrected_blob_region if fix_white_balance else blob_region
+            dominant_color, confidence = classify_region(region, lut)
+            color_text = f"LUT:{confidence:.2f} BGR:{blob_color}, "
+        else:
+            # Calculate the ratio of the brightest color to the sum of the other two colors
+            max_color = max(blob_color)
+            sum_other_colors = sum(blob_color) - max_color
 
-        blob_color_hsv = cv2.cvtColor(corrected_blob_region, cv2.COLOR_BGR2HSV)
-        saturation = blob_color_hsv[:, :, 1].mean()
+            color_ratio = max_color / sum_other_colors if sum_other_colors > 0 else 0  # Avoid division by zero
 
-        if color_ratio > ratio_threshold and saturation > saturation_threshold:
-            cv2.circle(output_blobs, (x, y), 5, (0, 0, 255), -1)  # Small red circle at the center
+            blob_color_hsv = cv2.cvtColor(corrected_blob_region, cv2.COLOR_BGR2HSV)
+            saturation = blob_color_hsv[:, :, 1].mean()
 
-            dominant_index = blob_color.index(max_color)
-            dominant_color = ["blue", "green", "red"][dominant_index]
-            dominant_colors.append(dominant_color)
+            if color_ratio > ratio_threshold and saturation > saturation_threshold:
+                dominant_index = blob_color.index(max_color)
+                dominant_color = ["blue", "green", "red"][dominant_index]
+                confidence = float(1 - max(ratio_threshold / color_ratio, saturation_threshold / saturation))
 
-        if draw:
-            print(color_ratio)
-            print(saturation)
-            print(dominant_colors)
+            # Prepare the text to display (BGR format, color ratio, and dominant color if applicable)
+            color_text = f"R:{color_ratio:.2f} S:{saturation:.0f} BGR:{blob_color}, "
 
-        # Prepare the text to display (BGR format, color ratio, and dominant color if applicable)
-        color_text = f"R:{color_ratio:.2f} S:{saturation:.0f} BGR:{blob_color}, "
         if dominant_color:
+            detections.append(Detection(dominant_color, x, y, keypoint.size, confidence))
             color_text += f", Dom: {dominant_color}"
 
-        # Prepare the text to display (BGR format and color ratio)
-        text_position = (x + 25, y) if x + 25 < img.shape[1] else (x - 25, y)  # Stay within image bounds
+        if overlay is not None:
+            if dominant_color:
+                cv2.circle(overlay, (x, y), 5, (0, 0, 255), -1)  # Small red circle at the center
 
-        # Put text on the image
-        cv2.putText(output_blobs, color_text, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.7, blob_color, 1,
-                    cv2.LINE_AA)
+            # Prepare the text to display (BGR format and color ratio)
+            text_position = (x + 25, y) if x + 25 < img.shape[1] else (x - 25, y)  # Stay within image bounds
 
-    if draw:
-        # Combine images for display
-        combined = np.hstack((img, output_blobs))
+            # Put text on the image
+            cv2.putText(overlay, color_text, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.7, blob_color, 1,
+                        cv2.LINE_AA)
 
-        cv2.imshow('Calibration', combined)
-        cv2.waitKey(1)
+    return detections
 
-    return dominant_colors
 
+def frame_signature(img, size=(16, 12)):
+    """
+    Get a tiny color version of a frame to tell cheaply whether the scene has changed. The color channels are kept, as
+    a sign can be swapped for one of another color with the same brightness.
 
-class ColorDetector:
-    def __init__(self, ip=None, use_pc_webcam=False):
+    :param img: The frame.
+    :param size: The width and height of the signature.
+    :return: The signature, an int16 array of shape (height, width, channels).
+    """
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def signature_difference(signature, other):
+    """
+    Compare two frame signatures. The largest difference of a cell is used rather than the mean, as a sign covers only
+    a few cells of the frame; the camera noise is averaged out within the cells.
+
+    :return: The largest absolute difference of a channel of a cell (0-255).
+    """
+    return int(np.abs(signature - other).max())
+
+
+def assign_to_zones(detections, n_players, width):
+    """
+    Assign the detected signs to players standing side by side, each in a fixed vertical zone of the frame (player 0
+    on the left of the image).
+
+    :param detections: A list of Detection.
+    :param n_players: The number of players.
+    :param width: The width of the frame in pixels.
+    :return: A list with the color of every player, None if a player shows no sign or several colors.
+    """
+    zones = [set() for _ in range(n_players)]
+    for detection in detections:
+        zone = min(n_players - 1, int(detection.x * n_players / width))
+        zones[zone].add(detection.color)
+    return [colors.pop() if len(colors) == 1 else None for colors in zones]
+
+
+class SignTracker:
+    def __init__(self, n_players, width, height, max_distance=None):
+        """
+        Assign the detected signs to players by their position, following each player as they move. The players start
+        in the centers of the zones of assign_to_zones.
+
+        :param n_players: The number of players.
+        :param width: The width of the frame in pixels.
+        :param height: The height of the frame in pixels.
+        :param max_distance: A sign further than this (in pixels) from every player is ignored; by default the width
+        of a zone.
+        """
+        self.positions = [((i + 0.5) * width / n_players, height / 2) for i in range(n_players)]
+        self.max_distance = max_distance if max_distance is not None else width / n_players
+
+    def assign(self, detections):
+        """
+        Assign the detected signs to the nearest players and move the players to their signs.
+
+        :param detections: A list of Detection.
+        :return: A list with the color of every player, None if a player shows no sign.
+        """
+        colors = [None] * len(self.positions)
+        pairs = sorted((math.dist(position, (detection.x, detection.y)), player, i)
+                       for player, position in enumerate(self.positions)
+                       for i, detection in enumerate(detections))
+        assigned = set()
+        # greedily pair the closest player and sign first
+        for distance, player, i in pairs:
+            if distance > self.max_distance or colors[player] is not None or i in assigned:
+                continue
+            colors[player] = detections[i].color
+            self.positions[player] = (detections[i].x, detections[i].y)
+            assigned.add(i)
+        return colors
+
+
+class DetectionPool:
+    """
+    A pool of worker threads running get_colors, shared by several ColorDetectors in one process (e.g. one per booth).
+    OpenCV releases the GIL in its heavy calls, so the detectors of different booths don't wait for each other.
+    """
+
+    def __init__(self, max_workers=None):
+        """
+        :param max_workers: The number of worker threads; by default one per booth is a good choice.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="detection")
+
+    def detect(self, img, **kwargs):
+        """
+        Run get_colors on a worker thread and wait for the result.
+
+        :param img: The image to detect the colors in.
+        :param kwargs: Keyword arguments passed to get_colors.
+        :return: The list of detected colors.
+        """
+        return self.executor.submit(get_colors, img, **kwargs).result()
+
+    def detect_all(self, img, **kwargs):
+        """
+        Run get_detections on a worker thread and wait for the result.
+
+        :param img: The image to detect the signs in.
+        :param kwargs: Keyword arguments passed to get_detections.
+        :return: The list of Detection.
+        """
+        return self.executor.submit(get_detections, img, **kwargs).result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class CalibrationView:
+    # trackbar name, parameter of get_detections, maximum position, scale of the position
+    TRACKBARS = [("Min Area", "min_area", 1000, 1),
+                 ("Max Area", "max_area", 10000, 1),
+                 ("Min Circularity", "min_circularity", 100, 100),
+                 ("Min Convexity", "min_convexity", 100, 100)]
+
+    def __init__(self, parameters, window_name="Calibration", max_fps=30):
+        """
+        The calibration window. It is rendered on the calling thread, as HighGUI only works on the main thread on some
+        platforms (e.g. macOS), while the detection runs on another thread; the window shows the newest annotated frame
+        at a capped rate, so the detection never waits for the display and the display never falls behind the camera.
+        The frames are drawn into two reused buffers: the detection draws into one while the other is shown.
+
+        :param parameters: The initial parameters of get_detections; the trackbars change them.
+        :param window_name: The name of the window.
+        :param max_fps: The highest rate at which the window is redrawn.
+        """
+        self.parameters = dict(parameters)
+        self.window_name = window_name
+        self.interval = 1.0 / max_fps
+        self.buffers = [None, None]
+        self.shown = 0  # index of the buffer that is shown
+        self.shown_time = None  # capture time of the frame in the shown buffer
+        self.n_frames = 0
+        self.n_skipped = 0
+        self.running = True
+        self._lock = threading.Lock()
+        cv2.namedWindow(self.window_name)
+        for name, parameter, maximum, scale in self.TRACKBARS:
+            cv2.createTrackbar(name, self.window_name, int(self.parameters[parameter] * scale), maximum,
+                               lambda x: None)
+
+    def back_buffer(self, img):
+        """
+        Get the buffer to draw the next frame on, a copy of *img*.
+
+        :param img: The frame.
+        :return: The buffer.
+        """
+        index = 1 - self.shown
+        if self.buffers[index] is None or self.buffers[index].shape != img.shape:
+            self.buffers[index] = np.empty_like(img)
+        np.copyto(self.buffers[index], img)
+        return self.buffers[index]
+
+    def publish(self, capture_time, n_skipped=0):
+        """
+        Show the back buffer from now on.
+
+        :param capture_time: The time the frame was captured.
+        :param n_skipped: The number of frames that arrived since the previous one and were not detected.
+        """
+        with self._lock:
+            self.shown = 1 - self.shown
+            self.shown_time = capture_time
+            self.n_frames += 1
+            self.n_skipped += n_skipped
+
+    def render(self):
+        """
+        Read the trackbars and show the newest frame; call it from the thread that created the view.
+
+        :return: Whether the window is still open, False once q or Esc is pressed or the window was closed.
+        """
+        for name, parameter, _, scale in self.TRACKBARS:
+            position = cv2.getTrackbarPos(name, self.window_name)
+            self.parameters[parameter] = position / scale if scale != 1 else position
+        with self._lock:
+            img = self.buffers[self.shown]
+            if img is not None:
+                # the lag from the capture of the frame to its display
+                lag = time.time() - self.shown_time
+                cv2.rectangle(img, (0, 0), (img.shape[1], 35), (0, 0, 0), -1)
+                cv2.putText(img, f"lag {lag * 1000:.0f} ms, detected {self.n_frames}, skipped {self.n_skipped}",
+                            (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2, cv2.LINE_AA)
+                cv2.imshow(self.window_name, img)
+        if cv2.waitKey(1) & 0xFF in (ord('q'), 27):
+            self.running = False
+        elif cv2.getWindowProperty(self.window_name, cv2.WND_PROP_VISIBLE) < 1:
+            self.running = False
+        return self.running
+
+    def run(self, worker):
+        """
+        Render the window at the capped rate until it is closed or the *worker* thread exits.
+
+        :param worker: The thread detecting the frames.
+        """
+        try:
+            last_render = 0
+            while self.running and worker.is_alive():
+                time.sleep(max(0.0, last_render + self.interval - time.time()))
+                last_render = time.time()
+                self.render()
+        finally:
+            self.running = False
+            worker.join()
+            cv2.destroyWindow(self.window_name)
+            cv2.waitKey(1)
 
-        self.imgs = queue.LifoQueue()  # LiFo queue to process most recent images first
 
+class ColorDetector:
+    def __init__(self, ip=None, use_pc_webcam=False, detection_pool=None, history=3.0, max_frames=120, lut=None,
+                 change_threshold=8, camera=True):
+        """
+        :param ip: The IP address of NAO, if its top camera is used.
+        :param use_pc_webcam: Use the desktop camera instead of NAO's.
+        :param detection_pool: Optional DetectionPool shared with other detectors.
+        :param history: How many seconds of recent frames are kept, so that detection can use frames captured before
+        it was called.
+        :param max_frames: The largest number of frames kept.
+        :param lut: An optional color table (see color_lut) to classify the blobs with.
+        :param change_threshold: How much a frame has to differ from the one detected last (see signature_difference)
+        to be detected again; otherwise the last result is reused. 0 detects every frame.
+        :param camera: Whether to connect to a camera; without one, the detector works on archived frames (see
+        calibrate).
+        """
+        # timestamped ring buffer of the most recent frames, (time, image) with the newest last
+        self.frames = collections.deque(maxlen=max_frames)
+        self.history = history
+        self.detection_pool = detection_pool
+        self.lut = lut
+        self.change_threshold = change_threshold
+        self.last_results = {}  # kind -> (signature of the frame, result), see detect_changed
+        self.archive = None  # optional frame_archive.FrameArchive for the frames used in detection
+
+        color_detectors.append(self)
+        if not camera:
+            return
+        # the devices are imported here, so that detection itself (e.g. on saved frames) doesn't need sic_framework
         global camera_device
         if use_pc_webcam:
+            from sic_framework.devices.desktop import Desktop
             print("USING PC WEBCAM")
             camera_device = Desktop().camera  # For some reason these need to be  global variables
 
         else:
             if not ip:
                 raise RuntimeError("ERROR: provide ip or set use_pc_webcam=True")
+            from sic_framework.devices import Nao
             camera_device = Nao(ip).top_camera
 
+        # keep every camera alive, not only the latest one, when several detectors run in one process
+        camera_devices.append(camera_device)
         camera_device.register_callback(self.on_image)
 
-    def on_image(self, image_message: CompressedImageMessage):
-        self.imgs.put(image_message.image)
-
-    def calibrate(self):
-        with self.imgs.mutex:
-            self.imgs.queue.clear()  # delete old images
-        self.imgs = queue.Queue()  # switch to FiFo queue for smoother display
-
-        # Create calibration windows and trackbars
-        current_parameters = get_default_args(get_colors)
-        print(current_parameters)
+    def on_image(self, image_message: "CompressedImageMessage"):
+        now = time.time()
+        frames_received.inc()
+        self.frames.append((now, image_message.image))
+        # drop frames older than the history
+        while self.frames and self.frames[0][0] < now - self.history:
+            self.frames.popleft()
 
-        window_name = 'Calibration'
-        cv2.namedWindow(window_name)
-
-        cv2.createTrackbar('Min Area', window_name, current_parameters["min_area"], 1000, self.trackbar_callback)
-        cv2.createTrackbar('Max Area', window_name, current_parameters["max_area"], 10000, self.trackbar_callback)
-        cv2.createTrackbar('Min Circularity', window_name, int(current_parameters["min_circularity"] * 100), 100,
-                           self.trackbar_callback)
-        cv2.createTrackbar('Min Convexity', window_name, int(current_parameters["min_convexity"] * 100), 100,
-                           self.trackbar_callback)
-
-        while True:
-            if not self.imgs.empty():
-                img = self.imgs.get()
-                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)  # Convert color space
-                img = cv2.flip(img, 1)
-                img = cv2.flip(img, -1)
+    def frames_since(self, timestamp):
+        """
+        Get the frames captured after a given time.
 
-                # Get trackbar values
-                min_area = cv2.getTrackbarPos('Min Area', 'Calibration')
-                max_area = cv2.getTrackbarPos('Max Area', 'Calibration')
-                min_circularity = cv2.getTrackbarPos('Min Circularity', 'Calibration') / 100.0
-                min_convexity = cv2.getTrackbarPos('Min Convexity', 'Calibration') / 100.0
+        :param timestamp: The time (as returned by time.time()).
+        :return: A list of (time, image) pairs, the newest last.
+        """
+        return [frame for frame in list(self.frames) if frame[0] > timestamp]
 
-                # Detect colors
-                get_colors(img, min_area, max_area, min_circularity, min_convexity)
+    def calibrate(self, max_fps=30, archive=None):
+        """
+        Show the camera with the detected blobs and trackbars to tune the detection parameters, until q or Esc is
+        pressed or the window is closed. Call it from the main thread. Only the newest frame is detected; frames that
+        arrive meanwhile are skipped, so the display stays real-time.
 
-    def trackbar_callback(self, x):
-        # Callback function for trackbar event
-        pass
+        :param max_fps: The highest rate at which the window is redrawn.
+        :param archive: Calibrate on the frames of an archive (see frame_archive), e.g. "output/game_1.frames",
+        instead of the camera. They are shown one after the other, over and over, at the rate of the window.
+        """
+        parameters = get_default_args(get_detections)
+        del parameters["overlay"]
+        parameters["lut"] = self.lut
+        print(parameters)
+        archived = None
+        if archive is not None:
+            from frame_archive import load_archive
+            archived, _ = load_archive(archive)
+            if len(archived) == 0:
+                raise ValueError(f"{archive} has no frames")
+        view = CalibrationView(parameters, max_fps=max_fps)
+        errors = []
+
+        def detect():
+            last_time = time.time()
+            position = 0
+            try:
+                while view.running:
+                    if archived is not None:
+                        time.sleep(view.interval)
+                        timestamp, img = time.time(), np.asarray(archived[position % len(archived)])
+                        position += 1
+                        n_skipped = 0
+                    elif not self.frames or self.frames[-1][0] <= last_time:
+                        time.sleep(0.005)
+                        continue
+                    else:
+                        timestamp, img = self.frames[-1]
+                        n_skipped = sum(1 for frame in self.frames_since(last_time) if frame[0] < timestamp)
+                    last_time = timestamp
+                    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)  # Convert color space
+                    img = cv2.flip(img, 0)  # the same as flipping horizontally and then both ways
+                    get_detections(img, overlay=view.back_buffer(img), **view.parameters)
+                    view.publish(timestamp, n_skipped)
+            except Exception as e:
+                errors.append(e)
+
+        # the window is rendered on this thread and the detection runs on a worker; the calibration ends when either
+        # of them stops
+        worker = threading.Thread(target=detect, name="calibration-detect", daemon=True)
+        worker.start()
+        view.run(worker)
+        if errors:
+            raise errors[0]
+
+    def get_colors(self, img):
+        return self.detect_changed("colors", img)
+
+    def get_detections(self, img):
+        return self.detect_changed("detections", img)
+
+    def detect_changed(self, kind, img):
+        """
+        Detect the signs in a frame, unless it looks the same as the frame detected last; then the last result is
+        reused. The frames are compared by their signatures (see frame_signature).
 
-    def detect_sign(self, max_duration=5):
+        :param kind: "colors" for get_colors or "detections" for get_detections.
+        :param img: The frame.
+        :return: The result of get_colors or get_detections.
+        """
+        signature = frame_signature(img) if self.change_threshold > 0 else None
+        cached = self.last_results.get(kind)
+        # compared with the frame that was detected, not the previous one, so a slow change adds up
+        if cached is not None and cached[0] is not None and signature is not None \
+                and signature_difference(signature, cached[0]) < self.change_threshold:
+            frames_reused.inc()
+            return cached[1]
+        with frame_seconds.time():
+            result = None
+            if self.detection_pool is not None:
+                try:
+                    if kind == "colors":
+                        result = self.detection_pool.detect(img, lut=self.lut)
+                    else:
+                        result = self.detection_pool.detect_all(img, lut=self.lut)
+                except (TimeoutError, BrokenProcessPool) as e:
+                    # the pool is optional, the session goes on with the detection in this thread
+                    if not pool_fallbacks.value:
+                        print(f"Detection pool failed ({e!r}), detecting in this thread")
+                    pool_fallbacks.inc()
+            if result is None:
+                result = (get_colors if kind == "colors" else get_detections)(img, lut=self.lut)
+        self.last_results[kind] = (signature, result)
+        return result
+
+    def record_detection(self, start_time, since, checked):
+        detection_seconds.observe(time.time() - start_time)
+        if checked:
+            last_checked = max(checked)
+            frames_skipped.inc(sum(1 for frame in self.frames_since(since)
+                                   if frame[0] < last_checked and frame[0] not in checked))
+
+    def detect_sign(self, max_duration=5, since=None, ids=(-1, 0)):
         """
-        :param max_duration:
+        Detect the sign shown to the camera. The newest frame is always checked first, and every frame only once.
+
+        :param max_duration: How long to look for a sign, in seconds.
+        :param since: Only use the frames captured after this time (as returned by time.time()), which can be before
+        this call, e.g. the moment NAO says "One, two, three!". By default, only frames captured after this call are
+        used.
+        :param ids: The game and round the frames are archived with, if an archive is set.
         :return: "red", "green", "blue" or None
         """
 
         print("Detecting sign...")
 
-        with self.imgs.mutex:
-            self.imgs.queue.clear()  # delete old images
         start_time = time.time()
+        if since is None:
+            since = start_time
+        checked = set()
+        color = None
+        # a result of an earlier round is never reused
+        self.last_results.clear()
 
-        i = 0
         while time.time() - start_time < max_duration:
-            i += 1
-            # print("detecting sign. Try nr. ", i + 1)
-
-            if not self.imgs.empty():
-                # print(self.imgs.qsize(), "self.imgs in queue")
-
-                img = self.imgs.get()
+            new_frames = [frame for frame in self.frames_since(since) if frame[0] not in checked]
+            if new_frames:
+                timestamp, img = new_frames[-1]
+                checked.add(timestamp)
+                if self.archive is not None:
+                    self.archive.submit(img, timestamp, *ids)
                 img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                colors = get_colors(img, draw=False)
+                colors = self.get_colors(img)
                 if len(colors) == 1:
-                    with self.imgs.mutex:
-                        self.imgs.queue.clear()  # delete old images
+                    color = colors[0]
+                    break
+            else:
+                time.sleep(0.01)
 
-                    return colors[0]
+        self.record_detection(start_time, since, checked)
+        return color  # None if there is no color found, or if there are several
+
+    def detect_signs(self, n_players, max_duration=5, since=None, ids=(-1, 0), tracker=None):
+        """
+        Detect the signs of several players in front of the camera in one pass. A player's sign is kept once it is
+        recognized, and the detection goes on until every player is recognized or the time is up.
+
+        :param n_players: The number of players.
+        :param max_duration: How long to look for the signs, in seconds.
+        :param since: Only use the frames captured after this time, see detect_sign.
+        :param ids: The game and round the frames are archived with, if an archive is set.
+        :param tracker: A SignTracker to assign the signs by the players' positions; by default every player has a
+        fixed zone of the frame (see assign_to_zones).
+        :return: A list with "red", "green", "blue" or None for every player.
+        """
+        print(f"Detecting signs of {n_players} players...")
+
+        start_time = time.time()
+        if since is None:
+            since = start_time
+        checked = set()
+        player_colors = [None] * n_players
+        # a result of an earlier round is never reused
+        self.last_results.clear()
+
+        while time.time() - start_time < max_duration and None in player_colors:
+            new_frames = [frame for frame in self.frames_since(since) if frame[0] not in checked]
+            if new_frames:
+                timestamp, img = new_frames[-1]
+                checked.add(timestamp)
+                if self.archive is not None:
+                    self.archive.submit(img, timestamp, *ids)
+                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                detections = self.get_detections(img)
+                if tracker is not None:
+                    colors = tracker.assign(detections)
+                else:
+                    colors = assign_to_zones(detections, n_players, img.shape[1])
+                player_colors = [old if old is not None else new for old, new in zip(player_colors, colors)]
             else:
                 time.sleep(0.01)
-                # print(" empty")
 
-        return None  # if there is no color found, or if there are several
+        self.record_detection(start_time, since, checked)
+        return player_colors
 
 
 camera_device = None  # This needs to be global for some reason
+camera_devices = []
+color_detectors = []
+
+frames_received = registry.counter("detector_frames_received_total", "Camera frames received")
+frames_skipped = registry.counter("detector_frames_skipped_total",
+                                  "Frames of a detection window that were never checked, the detection fell behind")
+frames_reused = registry.counter("detector_frames_reused_total",
+                                 "Frames not detected because they looked the same as the frame detected last")
+pool_fallbacks = registry.counter("detector_pool_fallbacks_total",
+                                  "Frames detected in the calling thread, as the detection pool timed out or broke")
+frame_seconds = registry.histogram("detector_frame_seconds", "Time to detect the signs in one frame")
+detection_seconds = registry.histogram("detector_detection_seconds", "Time until detect_sign/detect_signs returned")
+registry.gauge("detector_frames_buffered", "Frames in the history of the detectors",
+               lambda: sum(len(detector.frames) for detector in color_detectors))
+# a growing age means a stalled camera
+registry.gauge("detector_last_frame_age_seconds", "Time since the last frame of the stalest camera",
+               lambda: max((time.time() - detector.frames[-1][0] for detector in color_detectors if detector.frames),
+                           default=0))
 
 
 def main():
+    # e.g. python signdetector.py output/game_1.frames, to calibrate on archived frames instead of the camera
+    if len(sys.argv) > 1:
+        ColorDetector(camera=False).calibrate(archive=sys.argv[1])
+        return
     # color_detector = ColorDetector(use_pc_webcam=True)
     # color_detector = ColorDetector(ip="192.168.0.151")
     color_detector = ColorDetector(ip="10.0.0.91")
@@ -0,0 +1,269 @@
+from metrics import registry
+from personalities import expressions, instructions
+import subprocess
+import argparse
+import hashlib
+import shutil
+import json
+import wave
+import re
+import io
+import os
+
+cache_hits = registry.counter("tts_cache_hits_total", "Utterances played from the pre-synthesized cache")
+cache_misses = registry.counter("tts_cache_misses_total", "Utterances synthesized live, as they weren't in the cache")
+
+CACHE_FOLDER = "tts_cache"
+# NAO's speech tags, e.g. \pau=100\ or \rspd=90\
+SPEECH_TAG = re.compile(r"\\[a-z]+=\d+\\")
+
+
+class NaoEngine:
+    def __init__(self, ip, voice="naoenu", language="English", user="nao", remote_folder="/tmp/tts_cache"):
+        """
+        NAO's own text-to-speech engine: every utterance is rendered on the robot with ALTextToSpeech.sayToFile, with
+        the same speech tags as when NAO says it live, and the WAV file is then copied from the robot over ssh. The
+        cache played on NAO has to be built with this engine, so the participants hear one and the same voice whether
+        an utterance comes from the cache or is synthesized live.
+
+        :param ip: The IP address of NAO.
+        :param voice: The voice of ALTextToSpeech; NAO's live speech has to use the same.
+        :param language: The language of ALTextToSpeech.
+        :param user: The user to copy the files from the robot as, with a key set up for ssh.
+        :param remote_folder: The folder on the robot the utterances are rendered into.
+        """
+        self.ip = ip
+        self.voice = voice
+        self.language = language
+        self.user = user
+        self.remote_folder = remote_folder
+        self.parameters = {"engine": "naoqi", "voice": voice, "language": language}
+        self._tts = None
+
+    def connect(self):
+        if self._tts is None:
+            import qi
+            session = qi.Session()
+            session.connect(f"tcp://{self.ip}:9559")
+            self._tts = session.service("ALTextToSpeech")
+            self._tts.setLanguage(self.language)
+            self._tts.setVoice(self.voice)
+        return self._tts
+
+    def synthesize(self, text, speed):
+        """
+        Render a text on NAO and copy it from the robot.
+
+        :param text: The text, with NAO's speech tags.
+        :param speed: NAO's speed in percent.
+        :return: The audio as a WAV file.
+        """
+        name = hashlib.sha256(f"{speed}:{text}".encode("utf-8")).hexdigest() + ".wav"
+        remote_path = f"{self.remote_folder}/{name}"
+        target = f"{self.user}@{self.ip}"
+        subprocess.run(["ssh", target, "mkdir", "-p", self.remote_folder], capture_output=True, check=True)
+        # the same text as Robot.say sends for live speech
+        self.connect().sayToFile(f"\\rspd={speed}\\" + text, remote_path)
+        wav = subprocess.run(["ssh", target, "cat", remote_path], capture_output=True, check=True).stdout
+        subprocess.run(["ssh", target, "rm", "-f", remote_path], capture_output=True)
+        return wav
+
+
+class EspeakEngine:
+    def __init__(self, voice="en", base_wpm=175):
+        """
+        A local text-to-speech engine using the espeak-ng command, to build and test the cache without NAO. Its voice
+        differs from NAO's, so it is only for testing; Robot refuses it on the robot.
+
+        :param voice: The espeak-ng voice.
+        :param base_wpm: The words per minute at NAO's speed 100.
+        """
+        self.voice = voice
+        self.base_wpm = base_wpm
+        self.parameters = {"engine": "espeak-ng", "voice": voice, "base_wpm": base_wpm}
+
+    @staticmethod
+    def available():
+        return shutil.which("espeak-ng") is not None
+
+    def synthesize(self, text, speed):
+        """
+        Synthesize a text.
+
+        :param text: The text, NAO's speech tags are left out.
+        :param speed: NAO's speed in percent.
+        :return: The audio as a WAV file.
+        """
+        words_per_minute = str(int(self.base_wpm * speed / 100))
+        return subprocess.run(["espeak-ng", "-v", self.voice, "-s", words_per_minute, "--stdout",
+                               SPEECH_TAG.sub(" ", text)], capture_output=True, check=True).stdout
+
+
+class PlaceholderEngine:
+    def __init__(self, sample_rate=16000, seconds_per_char=0.06):
+        """
+        A stand-in engine that renders a quiet tone as long as the text would take to say, to test the cache and the
+        playback where no speech synthesizer is installed. Only for testing, like EspeakEngine.
+
+        :param sample_rate: The sample rate of the audio.
+        :param seconds_per_char: The duration per character at speed 100.
+        """
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+        self.parameters = {"engine": "placeholder", "sample_rate": sample_rate, "seconds_per_char": seconds_per_char}
+
+    def synthesize(self, text, speed):
+        import numpy as np
+        duration = len(SPEECH_TAG.sub("", text)) * self.seconds_per_char * 100 / speed
+        t = np.arange(int(duration * self.sample_rate)) / self.sample_rate
+        return to_wav((1000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16).tobytes(), self.sample_rate)
+
+
+def default_engine():
+    """
+    Get the local engine to build and test the cache with without NAO: espeak-ng if it is installed, otherwise the
+    placeholder. On the robot, the cache has to be built with NaoEngine.
+    """
+    return EspeakEngine() if EspeakEngine.available() else PlaceholderEngine()
+
+
+def to_wav(waveform, sample_rate):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(sample_rate)
+        file.writeframes(waveform)
+    return buffer.getvalue()
+
+
+def utterance_key(text, speed, parameters):
+    """
+    Get the key of an utterance in the cache: the hash of the text, the speed and the parameters of the engine, so an
+    entry is never used for other speech.
+
+    :param text: The text.
+    :param speed: NAO's speed in percent.
+    :param parameters: The parameters of the engine.
+    :return: The key, a hex string.
+    """
+    content = json.dumps({"text": text, "speed": speed, **parameters}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class UtteranceCache:
+    def __init__(self, engine, folder=CACHE_FOLDER):
+        """
+        A content-addressed cache of synthesized utterances: one WAV file per utterance, named by its key (see
+        utterance_key).
+
+        :param engine: The engine the utterances are (or were) synthesized with; its parameters are part of the keys.
+        :param folder: The folder of the cache.
+        """
+        self.engine = engine
+        self.folder = folder
+
+    def path(self, text, speed):
+        return os.path.join(self.folder, utterance_key(text, speed, self.engine.parameters) + ".wav")
+
+    def add(self, text, speed):
+        """
+        Synthesize an utterance into the cache, unless it is there already.
+
+        :param text: The text.
+        :param speed: NAO's speed in percent.
+        :return: Whether it was synthesized.
+        """
+        path = self.path(text, speed)
+        if os.path.exists(path):
+            return False
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(self.engine.synthesize(text, speed))
+        os.replace(tmp_path, path)
+        return True
+
+    def get(self, text, speed):
+        """
+        Get an utterance from the cache.
+
+        :param text: The text.
+        :param speed: NAO's speed in percent.
+        :return: The 16-bit mono waveform and its sample rate, or None if the utterance isn't in the cache.
+        """
+        try:
+            with wave.open(self.path(text, speed), 'rb') as file:
+                audio = file.readframes(file.getnframes()), file.getframerate()
+        except FileNotFoundError:
+            cache_misses.inc()
+            return None
+        cache_hits.inc()
+        return audio
+
+
+def speeches(expression):
+    """
+    Get the speeches of an expression of personalities.expressions.
+
+    :param expression: The (nested) dictionary of an expression.
+    :return: A generator of the speeches.
+    """
+    for key, value in expression.items():
+        if isinstance(value, dict):
+            yield from speeches(value)
+        elif key in ("speech", "goodbye") and isinstance(value, str):
+            yield value
+
+
+def known_utterances(robots):
+    """
+    Get every utterance with a fixed text: the fixed phrases of game.py, the instructions and the speeches of every
+    personality with its robot's name. Texts with scores or the players' choices are synthesized live.
+
+    :param robots: The robots of the game, see Game.robots.
+    :return: A sorted list of (text, speed).
+    """
+    from game import DEFAULT_SPEED, FIXED_PHRASES, WELCOME
+
+    class Named:
+        def __init__(self, name):
+            self.name = name
+
+    utterances = set(FIXED_PHRASES)
+    utterances.add((instructions, DEFAULT_SPEED))
+    utterances.add((WELCOME.format(name=robots["instructor"]["name"]), DEFAULT_SPEED))
+    for personality, expression in expressions.items():
+        for speech in speeches(expression):
+            # the greetings contain the name of the robot, see Robot.personal_greeting
+            utterances.add((speech.format(self=Named(robots[personality]["name"])), DEFAULT_SPEED))
+    return sorted(utterances)
+
+
+def build_cache(engine, folder=CACHE_FOLDER):
+    """
+    Synthesize every known utterance into the cache.
+
+    :param engine: The engine.
+    :param folder: The folder of the cache.
+    :return: The cache and the number of utterances synthesized.
+    """
+    from game import Game
+    cache = UtteranceCache(engine, folder)
+    n_synthesized = sum(cache.add(text, speed) for text, speed in known_utterances(Game(n_game=0).robots))
+    return cache, n_synthesized
+
+
+if __name__ == '__main__':
+    # e.g. python tts_cache.py --nao 10.0.0.91, or python tts_cache.py [--placeholder] for testing without NAO
+    parser = argparse.ArgumentParser(description="Synthesize NAO's fixed utterances ahead of time.")
+    parser.add_argument("--nao", help="the IP address of NAO, to render the utterances with NAO's own voice")
+    parser.add_argument("--placeholder", action="store_true", help="use the placeholder engine, even with espeak-ng")
+    parser.add_argument("--folder", default=CACHE_FOLDER)
+    args = parser.parse_args()
+    if args.nao is not None:
+        engine = NaoEngine(args.nao)
+    else:
+        engine = PlaceholderEngine() if args.placeholder else default_engine()
+    _, n_synthesized = build_cache(engine, args.folder)
+    print(f"Synthesized {n_synthesized} utterances with {engine.parameters['engine']} into {args.folder}")
@@ -0,0 +1,197 @@
+from metrics import registry
+import collections
+import threading
+import numpy as np
+import time
+
+audio_received = registry.counter("speech_audio_received_bytes_total", "Microphone audio seen by the speech gate")
+audio_passed = registry.counter("speech_audio_passed_bytes_total", "Microphone audio let through during speech")
+
+
+class VoiceActivityGate:
+    def __init__(self, sample_rate, frame_ms=30, pre_roll_ms=300, hangover_ms=600, start_frames=3,
+                 min_level=300, noise_factor=3.0):
+        """
+        An energy-based voice activity detector between the microphone and the recognizer. Audio is only let through
+        while someone speaks: a short pre-roll before the speech is kept so the first syllable isn't cut off, and the
+        utterance ends once it has been silent for *hangover_ms*.
+
+        :param sample_rate: The sample rate of the 16-bit mono audio (16000 for NAO, 44100 for the desktop).
+        :param frame_ms: The length of the frames the energy is measured on.
+        :param pre_roll_ms: How much audio before the start of the speech is sent along.
+        :param hangover_ms: How long it has to be silent to end the utterance.
+        :param start_frames: How many loud frames in a row start an utterance.
+        :param min_level: The lowest RMS level (of 32768) that counts as speech.
+        :param noise_factor: How much louder than the background noise speech has to be.
+        """
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * 2
+        self.pre_roll = collections.deque(maxlen=max(1, pre_roll_ms // frame_ms))
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.start_frames = start_frames
+        self.min_level = min_level
+        self.noise_factor = noise_factor
+        self.noise_level = float(min_level) / noise_factor
+        self.speaking = False
+        self.loud_frames = 0
+        self.silent_frames = 0
+        self.buffer = b""
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def is_speech(self, frame):
+        level = np.sqrt(np.mean(np.frombuffer(frame, dtype=np.int16).astype(np.float32) ** 2))
+        speech = level > max(self.min_level, self.noise_level * self.noise_factor)
+        if not speech:
+            # follow the background noise slowly
+            self.noise_level = 0.95 * self.noise_level + 0.05 * level
+        return speech
+
+    def feed(self, chunk):
+        """
+        Feed audio from the microphone.
+
+        :param chunk: 16-bit little-endian mono PCM audio of any length.
+        :return: The audio to send to the recognizer (empty outside of speech), whether an utterance started and
+        whether it ended in this chunk.
+        """
+        self.bytes_in += len(chunk)
+        self.buffer += chunk
+        output = []
+        started = ended = False
+        while len(self.buffer) >= self.frame_bytes:
+            frame, self.buffer = self.buffer[:self.frame_bytes], self.buffer[self.frame_bytes:]
+            speech = self.is_speech(frame)
+            if not self.speaking:
+                self.pre_roll.append(frame)
+                self.loud_frames = self.loud_frames + 1 if speech else 0
+                if self.loud_frames >= self.start_frames:
+                    self.speaking = started = True
+                    self.silent_frames = 0
+                    output.extend(self.pre_roll)
+                    self.pre_roll.clear()
+            else:
+                output.append(frame)
+                self.silent_frames = 0 if speech else self.silent_frames + 1
+                if self.silent_frames >= self.hangover_frames:
+                    self.speaking = False
+                    self.loud_frames = 0
+                    ended = True
+                    break
+        audio = b"".join(output)
+        self.bytes_out += len(audio)
+        audio_received.inc(len(chunk))
+        audio_passed.inc(len(audio))
+        return audio, started, ended
+
+
+class SpeechMonitor:
+    def __init__(self, microphone, sample_rate, **kwargs):
+        """
+        Watch the microphone and report when someone starts speaking, so that the robot doesn't wait for the full
+        timeout of a speech recognition request when nobody answers.
+
+        :param microphone: The sic_framework microphone connector (NAO's mic or the DesktopMicrophone).
+        :param sample_rate: The sample rate of the microphone.
+        :param kwargs: Parameters of the VoiceActivityGate.
+        """
+        self.gate = VoiceActivityGate(sample_rate, **kwargs)
+        self.speech_started = threading.Event()
+        self.lock = threading.Lock()
+        microphone.register_callback(self.on_audio)
+
+    def on_audio(self, message):
+        with self.lock:
+            _, started, _ = self.gate.feed(bytes(message.waveform))
+        if started:
+            self.speech_started.set()
+
+    def wait_for_speech(self, timeout):
+        """
+        Wait until someone starts speaking.
+
+        :param timeout: How long to wait, in seconds.
+        :return: Whether speech started within the time (or someone is speaking already).
+        """
+        with self.lock:
+            self.speech_started.clear()
+            if self.gate.speaking:
+                return True
+        return self.speech_started.wait(timeout)
+
+
+class LocalRecognizer:
+    def __init__(self, transcript="", bytes_per_second=32000, latency=0.2):
+        """
+        A stand-in for the streaming recognizer, to test the gating with recorded audio without Dialogflow. It returns
+        a fixed transcript a fixed *latency* after the end of the audio it was sent.
+
+        :param transcript: The transcript it returns.
+        :param bytes_per_second: The rate of the audio, to compute the duration of what was sent.
+        :param latency: The time from the end of the stream to the final transcript, in seconds.
+        """
+        self.transcript = transcript
+        self.bytes_per_second = bytes_per_second
+        self.latency = latency
+        self.bytes_received = 0
+
+    def recognize(self, chunks):
+        """
+        Recognize a stream of audio.
+
+        :param chunks: An iterable of audio chunks.
+        :return: The transcript and the audio time (in seconds) from the start of the stream to the final transcript.
+        """
+        received = 0
+        for chunk in chunks:
+            received += len(chunk)
+        self.bytes_received += received
+        return self.transcript, received / self.bytes_per_second + self.latency
+
+
+def gated_utterances(chunks, gate):
+    """
+    Split a stream of audio into utterances with a gate.
+
+    :param chunks: An iterable of audio chunks, e.g. read from a recording.
+    :param gate: A VoiceActivityGate.
+    :return: A generator of utterances, each a list of audio chunks.
+    """
+    utterance = None
+    for chunk in chunks:
+        audio, started, ended = gate.feed(chunk)
+        if started:
+            utterance = []
+        if utterance is not None and audio:
+            utterance.append(audio)
+        if ended and utterance is not None:
+            yield utterance
+            utterance = None
+    if utterance:
+        yield utterance
+
+
+def read_chunks(wav_file, chunk_ms=100, realtime=False):
+    """
+    Read a 16-bit mono WAV recording in chunks, like a microphone would deliver it.
+
+    :param wav_file: The path to the recording.
+    :param chunk_ms: The length of a chunk.
+    :param realtime: Whether to wait between the chunks like a live microphone.
+    :return: The sample rate and a generator of chunks.
+    """
+    import wave
+    recording = wave.open(wav_file, 'rb')
+    sample_rate = recording.getframerate()
+    frames_per_chunk = int(sample_rate * chunk_ms / 1000)
+
+    def chunks():
+        with recording:
+            while True:
+                data = recording.readframes(frames_per_chunk)
+                if not data:
+                    break
+                if realtime:
+                    time.sleep(chunk_ms / 1000)
+                yield data
+
+    return sample_rate, chunks()